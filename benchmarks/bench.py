@@ -0,0 +1,261 @@
+"""
+Benchmarks of the step, diffusion, density and render paths
+
+Every method is timed on every scenario of benchmarks/scenarios.py, for some
+grid sizes and crowd densities, from fixed seeds. A result gives the ticks
+(calls of the method) per second, the players * ticks per second and the peak
+of the memory allocated during the ticks (tracemalloc, measured over the first
+TICKS_MEMOIRE ticks of a second run, so that it does not slow down the timed
+one).
+
+    python -m benchmarks.bench -o avant.json
+    git checkout autre-branche
+    python -m benchmarks.bench -o apres.json
+    python -m benchmarks.bench --comparer avant.json apres.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+import pygame as pg
+
+from benchmarks.scenarios import SCENARIOS
+
+
+METHODES = (
+    "apply_rules",
+    "apply_rules_parallel",
+    "apply_rules_vectorized",
+    "diffusion_Field",
+    "recuperer_max_densite_grille",
+    "draw",
+    "draw_array",
+)
+
+TAILLES = ((60, 30), (120, 60))
+DENSITES = (0.1, 0.3)
+
+# ticks of the run under tracemalloc, which is several times slower
+TICKS_MEMOIRE = 5
+
+# size of the cells in the render benchmarks
+TAILLE_CELLULE = 8
+
+ETA, MU, NU = 10, 0.5, 0.5
+
+
+def _operation(simulation, methode):
+    """one tick of a method on a simulation"""
+    grille = simulation.map
+    match methode:
+        case "apply_rules":
+            return lambda: simulation.apply_rules(ETA, NU)
+        case "apply_rules_parallel":
+            return lambda: simulation.apply_rules_parallel(ETA, MU, NU)
+        case "apply_rules_vectorized":
+            return lambda: simulation.apply_rules_vectorized(ETA, MU, NU)
+        case "diffusion_Field":
+            # the players lay the field as in moteur.deplacer, then it diffuses
+            def tick():
+                ids = grille.agents.vivants()
+                positions = grille.agents.x[ids] * grille.nb_lignes + grille.agents.y[ids]
+                grille.deposer_champ(grille.agents.classe[ids], positions, 1.0)
+                grille.diffusion_Field()
+
+            return tick
+        case "recuperer_max_densite_grille":
+
+            def tick():
+                grille.densite.invalider()
+                grille.recuperer_max_densite_grille()
+
+            return tick
+        case "draw" | "draw_array":
+            pg.init()
+            # the same cells for both paths: draw uses taille_cellule,
+            # draw_array scales its image by echelle
+            grille.taille_cellule = TAILLE_CELLULE
+            grille.echelle = TAILLE_CELLULE
+            fenetre = pg.Surface(
+                (grille.nb_colonnes * TAILLE_CELLULE, grille.nb_lignes * TAILLE_CELLULE)
+            )
+            dessiner = getattr(simulation, methode)
+            return lambda: dessiner(fenetre)
+    raise ValueError(f"unknown method {methode}")
+
+
+def mesurer(scenario, nb_colonnes, nb_lignes, densite, methode, ticks=50, graine=0):
+    """time ticks calls of a method on a scenario, return a row of results"""
+    construire = SCENARIOS[scenario]
+
+    simulation = construire(nb_colonnes, nb_lignes, densite, graine)
+    operation = _operation(simulation, methode)
+    joueurs = 0
+    debut = time.perf_counter()
+    for _ in range(ticks):
+        joueurs += len(simulation.map.agents)
+        operation()
+    secondes = time.perf_counter() - debut
+
+    simulation = construire(nb_colonnes, nb_lignes, densite, graine)
+    operation = _operation(simulation, methode)
+    tracemalloc.start()
+    for _ in range(min(ticks, TICKS_MEMOIRE)):
+        operation()
+    memoire_max = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "scenario": scenario,
+        "colonnes": nb_colonnes,
+        "lignes": nb_lignes,
+        "densite": densite,
+        "methode": methode,
+        "ticks": ticks,
+        "secondes": secondes,
+        "ticks_s": ticks / secondes,
+        "agents_ticks_s": joueurs / secondes,
+        "memoire_max": memoire_max,
+    }
+
+
+def revision():
+    """git commit of the tree, with + if it has local changes (None outside git)"""
+    dossier = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=dossier, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        modifie = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=dossier, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("+" if modifie else "")
+
+
+def executer(
+    scenarios=tuple(SCENARIOS),
+    tailles=TAILLES,
+    densites=DENSITES,
+    methodes=METHODES,
+    ticks=50,
+    graine=0,
+    afficher=print,
+) -> dict:
+    """run every combination, return the results with the environment"""
+    resultats = []
+    for scenario in scenarios:
+        for nb_colonnes, nb_lignes in tailles:
+            for densite in densites:
+                for methode in methodes:
+                    ligne = mesurer(
+                        scenario, nb_colonnes, nb_lignes, densite, methode, ticks, graine
+                    )
+                    resultats.append(ligne)
+                    if afficher is not None:
+                        afficher(_formater(ligne))
+    return {
+        "revision": revision(),
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processeur": platform.processor(),
+        "resultats": resultats,
+    }
+
+
+def _cle(ligne):
+    return (ligne["scenario"], ligne["colonnes"], ligne["lignes"], ligne["densite"], ligne["methode"])
+
+
+def _formater(ligne):
+    scenario, nb_colonnes, nb_lignes, densite, methode = _cle(ligne)
+    return (
+        f"{scenario:<10} {nb_colonnes:>4}x{nb_lignes:<4} {densite:<5} {methode:<29}"
+        f"{ligne['ticks_s']:>10.1f} ticks/s {ligne['agents_ticks_s']:>12.0f} agents*ticks/s"
+        f" {ligne['memoire_max'] / 2**20:>8.2f} Mo"
+    )
+
+
+def comparer(avant: dict, apres: dict) -> list:
+    """rows of the results of two runs: (key, ticks/s before, after, ratio,
+    peak memory ratio), for the keys found in both"""
+    anciens = {_cle(ligne): ligne for ligne in avant["resultats"]}
+    lignes = []
+    for ligne in apres["resultats"]:
+        ancienne = anciens.get(_cle(ligne))
+        if ancienne is None:
+            continue
+        lignes.append(
+            (
+                _cle(ligne),
+                ancienne["ticks_s"],
+                ligne["ticks_s"],
+                ligne["ticks_s"] / ancienne["ticks_s"],
+                ligne["memoire_max"] / max(ancienne["memoire_max"], 1),
+            )
+        )
+    return lignes
+
+
+def _taille(texte):
+    nb_colonnes, nb_lignes = texte.lower().split("x")
+    return int(nb_colonnes), int(nb_lignes)
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("-o", "--sortie", help="JSON file of the results")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--tailles", nargs="+", type=_taille, default=list(TAILLES), help="e.g. 60x30")
+    parser.add_argument("--densites", nargs="+", type=float, default=list(DENSITES))
+    parser.add_argument("--methodes", nargs="+", choices=METHODES, default=list(METHODES))
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument(
+        "--comparer", nargs=2, metavar=("AVANT", "APRES"), help="compare two JSON files"
+    )
+    arguments = parser.parse_args(arguments)
+
+    if arguments.comparer:
+        fichiers = []
+        for chemin in arguments.comparer:
+            with open(chemin) as fichier:
+                fichiers.append(json.load(fichier))
+        avant, apres = fichiers
+        print(f"{avant['revision']} -> {apres['revision']}")
+        for cle, ancien, nouveau, ratio, memoire in comparer(avant, apres):
+            scenario, nb_colonnes, nb_lignes, densite, methode = cle
+            print(
+                f"{scenario:<10} {nb_colonnes:>4}x{nb_lignes:<4} {densite:<5} {methode:<29}"
+                f"{ancien:>10.1f} -> {nouveau:>10.1f} ticks/s  x{ratio:<6.2f} memoire x{memoire:.2f}"
+            )
+        return
+
+    resultats = executer(
+        arguments.scenarios,
+        arguments.tailles,
+        arguments.densites,
+        arguments.methodes,
+        arguments.ticks,
+        arguments.graine,
+    )
+    if arguments.sortie:
+        with open(arguments.sortie, "w") as fichier:
+            json.dump(resultats, fichier, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Standard scenarios of the benchmarks
+
+Every scenario builds a headless simulation (see Simulation with fenetre=None)
+of a given size and crowd density from a fixed seed, so that two runs of the
+benchmarks, on two revisions, start from the same grid:
+
+- salle : empty room, one exit at the bottom
+- goulot : bottleneck, the crowd leaves the top of the room by a door of two
+  cells in a wall across the room
+- croisement : four classes crossing the room towards the four sides
+- couloir : corridor fed by a productor, with a dynamic field
+- enclos : walking distances, with some players shut in boxes of walls from
+  which the exit can not be reached
+"""
+
+import random
+
+import numpy as np
+
+from simulation.cell import TYPE_CELL
+from simulation.simulation import Simulation
+
+
+def _simulation(nb_colonnes, nb_lignes, graine, **parametres):
+    random.seed(graine)
+    np.random.seed(graine)
+    return Simulation(
+        None,
+        nb_colonnes,
+        nb_lignes,
+        proba_wall=0,
+        seed=graine,
+        **parametres,
+    )
+
+
+def _peupler(simulation, densite, lignes=None):
+    """add players on a fraction densite of the empty cells (of some rows)"""
+    grille = simulation.map
+    libres = grille.etats == TYPE_CELL.VIDE.value
+    if lignes is not None:
+        libres[:, : lignes.start] = False
+        libres[:, lignes.stop :] = False
+    joueurs = libres & (np.random.random(libres.shape) < densite)
+    for x, y in zip(*np.nonzero(joueurs)):
+        grille.add_player(x, y)
+
+
+def salle(nb_colonnes, nb_lignes, densite, graine=0) -> Simulation:
+    simulation = _simulation(
+        nb_colonnes, nb_lignes, graine, classes=1, Productor=False, exit=True
+    )
+    _peupler(simulation, densite)
+    return simulation
+
+
+def goulot(nb_colonnes, nb_lignes, densite, graine=0) -> Simulation:
+    simulation = _simulation(
+        nb_colonnes, nb_lignes, graine, classes=1, Productor=False, exit=True
+    )
+    grille = simulation.map
+    y_mur = nb_lignes // 2
+    for x in range(1, nb_colonnes - 1):
+        if x not in (nb_colonnes // 2, nb_colonnes // 2 + 1):
+            grille.ajouter_mur(x, y_mur)
+    grille.gradient_obstacle(0.3)
+    _peupler(simulation, densite, range(1, y_mur))
+    return simulation
+
+
+def croisement(nb_colonnes, nb_lignes, densite, graine=0) -> Simulation:
+    simulation = _simulation(
+        nb_colonnes, nb_lignes, graine, classes=4, Productor=False, exit=True
+    )
+    _peupler(simulation, densite)
+    return simulation
+
+
+def couloir(nb_colonnes, nb_lignes, densite, graine=0) -> Simulation:
+    simulation = _simulation(
+        nb_colonnes,
+        nb_lignes,
+        graine,
+        classes=2,
+        Productor=True,
+        coeff_prod=0.5,
+        exit=True,
+        Diff=0.1,
+    )
+    # the productor is at (nb_colonnes - 2, nb_lignes // 2), the corridor
+    # leads from it to the middle of the room
+    grille = simulation.map
+    for x in range(nb_colonnes // 2, nb_colonnes - 1):
+        grille.ajouter_mur(x, nb_lignes // 2 - 2)
+        grille.ajouter_mur(x, nb_lignes // 2 + 2)
+    grille.gradient_obstacle(0.3)
+    _peupler(simulation, densite, range(nb_lignes // 2 - 1, nb_lignes // 2 + 2))
+    return simulation
+
+
+def enclos(nb_colonnes, nb_lignes, densite, graine=0) -> Simulation:
+    simulation = _simulation(
+        nb_colonnes,
+        nb_lignes,
+        graine,
+        classes=1,
+        Productor=False,
+        exit=True,
+        geodesique=True,
+    )
+    _peupler(simulation, densite)
+    # a box of walls around a player every 10 columns: the distances of its
+    # cells are the distance of the unreachable cells
+    grille = simulation.map
+    for x in range(5, nb_colonnes - 5, 10):
+        y = nb_lignes // 3
+        for dx, dy in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+            grille.ajouter_mur(x + dx, y + dy)
+        grille.add_player(x, y)
+    grille.gradient_obstacle(0.3)
+    return simulation
+
+
+SCENARIOS = {
+    "salle": salle,
+    "goulot": goulot,
+    "croisement": croisement,
+    "couloir": couloir,
+    "enclos": enclos,
+}
@@ -13,9 +13,15 @@ import pygame as pg
 import sys
 import random
 from simulation.simulation import Simulation, ACTIONS
+from simulation.ordonnanceur import Ordonnanceur
+from simulation.travailleur import Travailleur
+from simulation.trajectoires import Trajectoire
+from simulation.sauvegarde import sauvegarder, restaurer
 import time
 from style.button import Button
 from style.text_input import TextInput
+from style.text_cache import cache_texte
+from style.hud import Hud
 
 
 
@@ -34,7 +40,7 @@ class Game:
     - SCREEN_WIDTH : int : width of the screen
     - clock : pg.time.Clock : clock object to manage the game speed
     - eta : float : parameter for the parallel version of the simulation
-    - parallel : bool : True if the parallel version of the simulation is used
+    - parallel : int : 0 sequential, 1 parallel, 2 vectorized version of the simulation
     - colors : dict : dictionnary of colors used in the game
     - param : dict : dictionnary of parameters for the simulation
     - update_screen_infos : update SCREEN_WIDTH and SCREEN_HEIGHT
@@ -45,6 +51,7 @@ class Game:
     - handle_events : handle events for the menu screen
     - menu : display the menu screen and handle events
     - run_simulation : run the simulation with the chosen mode
+    - run_replay : replay the trajectories recorded in the file trajectory
     - jouer : main function that manages the passage between the menu and the simulation
 
 
@@ -53,7 +60,7 @@ class Game:
     def __init__(self):
         pg.init()
         self.state = "MENU"
-        self.menu_choices = ["Random", "Choose"]
+        self.menu_choices = ["Random", "Choose", "Replay", "Restore"]
         self.SCREEN_HEIGHT = 0
         self.SCREEN_WIDTH = 0
         self.clock = pg.time.Clock()
@@ -76,7 +83,16 @@ class Game:
             "Decay": 0,
             "show_gradient": 0,
             "change_class": 0.001,
-
+            "geodesic": 0,
+            "grad_range": 2,
+            "render": 0,
+            "tps": 20,
+            "fps": 30,
+            "worker": 0,
+            "profile": 0,
+            "metrics": "",
+            "trajectory": "",
+            "snapshot": "",
         }
 
         self.colors = {
@@ -316,6 +332,106 @@ class Game:
                 active_color=self.colors["hover"],
                 text=str(self.param["change_class"]),
             ),
+            "geodesic": TextInput(
+                x=self.SCREEN_WIDTH // 2 - 500,
+                y=700,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["geodesic"]),
+            ),
+            "grad_range": TextInput(
+                x=self.SCREEN_WIDTH // 2 - 500,
+                y=750,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["grad_range"]),
+            ),
+            "render": TextInput(
+                x=self.SCREEN_WIDTH // 2 - 500,
+                y=800,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["render"]),
+            ),
+            "tps": TextInput(
+                x=self.SCREEN_WIDTH // 2 + 300,
+                y=450,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["tps"]),
+            ),
+            "fps": TextInput(
+                x=self.SCREEN_WIDTH // 2 - 500,
+                y=450,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["fps"]),
+            ),
+            "worker": TextInput(
+                x=self.SCREEN_WIDTH // 2 + 300,
+                y=400,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["worker"]),
+            ),
+            "profile": TextInput(
+                x=self.SCREEN_WIDTH // 2 - 500,
+                y=400,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["profile"]),
+            ),
+            "metrics": TextInput(
+                x=self.SCREEN_WIDTH // 2 - 500,
+                y=350,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["metrics"]),
+            ),
+            "trajectory": TextInput(
+                x=self.SCREEN_WIDTH // 2 + 300,
+                y=350,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["trajectory"]),
+            ),
+            "snapshot": TextInput(
+                x=self.SCREEN_WIDTH // 2 + 300,
+                y=300,
+                width=200,
+                height=40,
+                font=input_font,
+                color=self.colors["text"],
+                active_color=self.colors["hover"],
+                text=str(self.param["snapshot"]),
+            ),
         }
         # Button dimensions and positions
         button_width, button_height = 200, 60
@@ -323,7 +439,7 @@ class Game:
         for i, choice in enumerate(self.menu_choices):
             buttons[choice] = Button(
                 x=self.SCREEN_WIDTH // 2 - button_width // 2,
-                y=300 + i * 100,
+                y=220 + i * 70,
                 width=button_width,
                 height=button_height,
                 text=choice,
@@ -347,7 +463,7 @@ class Game:
                 break
 
             for label, input_field in inputs.items():
-                input_text = input_font.render(label, True, self.colors["text"])
+                input_text = cache_texte.render(label, 36, self.colors["text"])
                 fenetre.blit(
                     input_text, (input_field.rect.x - 150, input_field.rect.y + 5)
                 )
@@ -387,6 +503,14 @@ class Game:
         flag = True
 
         # Initialize simulation
+        if self.state == "Restore":
+            flag = False
+            try:
+                simulation = restaurer(self.param["snapshot"], fenetre)
+            except OSError:
+                print(f"no snapshot {self.param['snapshot']!r}")
+                self.state = "MENU"
+                return
         if flag:
             flag = False
             simulation = Simulation(
@@ -403,9 +527,13 @@ class Game:
                 float(self.param["Diff"]),
                 float(self.param["Decay"]),
                 bool(int(self.param["show_gradient"])),
-                float(self.param['change_class'])
+                float(self.param['change_class']),
+                geodesique=bool(int(self.param["geodesic"])),
             )
 
+        if int(self.param["profile"]):
+            simulation.profileur.activer()
+
         if self.state == "Random":
             simulation.random_setup()
         elif self.state == "Choose":
@@ -414,135 +542,288 @@ class Game:
         simulation.draw(fenetre)
         pg.display.update()
 
-        simulation.map.gradient_obstacle(float(self.param["grad_coeff"]), 2)
+        # a restored simulation keeps the gradient it was saved with
+        if self.state != "Restore":
+            simulation.map.gradient_obstacle(
+                float(self.param["grad_coeff"]), int(self.param["grad_range"])
+            )
+
+        eta = float(self.param["eta"])
+        mu = float(self.param["mu"])
+        nu = float(self.param["nu"])
+        parallel = int(self.param["Parallel"])
+
+        # the worker steps its own copy of the simulation, the edits are sent to it
+        travailleur = None
+        if int(self.param["worker"]):
+            travailleur = Travailleur(
+                simulation,
+                eta,
+                mu,
+                nu,
+                parallel,
+                float(self.param["tps"]),
+                float(self.param["fps"]),
+            )
+
+        # values of every step, written at the end in the file metrics
+        if self.param["metrics"] and travailleur is None:
+            simulation.enregistrer_metriques()
+        # positions of every step, replayed with the Replay button
+        if self.param["trajectory"] and travailleur is None:
+            simulation.enregistrer_trajectoire(self.param["trajectory"])
 
         def add(x, y, action):
-            if x >= simulation.map.nb_colonnes or y >= simulation.map.nb_lignes:
-                return
-            cell = simulation.map.cellule(x, y)
-            match action:
-                case ACTIONS.ADDING_WALLS:
-                    simulation.map.ajouter_mur(x, y)
-                case ACTIONS.ADDING_DOORS:
-                    simulation.map.ajouter_porte(x, y)
-                case ACTIONS.ADDING_PLAYERS:
-                    simulation.map.add_player(x, y)
-                case ACTIONS.ADDING_PRODUCTORS:
-                    simulation.map.add_productor(x, y)
-                case ACTIONS.ADDING_EMPTY:
-                    cell.empty()
-                case ACTIONS.CHANGE_ATTRACTOR1:
-                    cell.change_attractor(0)
-                case ACTIONS.CHANGE_ATTRACTOR2:
-                    cell.change_attractor(1)
-                case ACTIONS.CHANGE_ATTRACTOR3:
-                    cell.change_attractor(2)
-                case ACTIONS.CHANGE_ATTRACTOR4:
-                    cell.change_attractor(3)
-                case ACTIONS.DO_NOTHING:
-                    pass
-            cell.draw(simulation.fenetre)
+            if travailleur is not None:
+                travailleur.editer(x, y, action)
+            else:
+                simulation.editer(x, y, action)
+
+        def classe(k, ouvrir):
+            if travailleur is not None:
+                travailleur.envoyer("open_class" if ouvrir else "delete_class", k)
+            elif ouvrir:
+                simulation.map.open_class(k)
+            else:
+                simulation.map.delete_class(k)
 
         running = True
         action = ACTIONS.DO_NOTHING
+        density_rect = pg.Rect(0, 0, 0, 0)
+        hud = Hud(budget=1 / float(self.param["fps"]))
+        hud_rect = hud.rect
+        # with a worker, the window only schedules its frames
+        ordonnanceur = Ordonnanceur(
+            0 if travailleur is not None else float(self.param["tps"]),
+            float(self.param["fps"]),
+        )
 
         pg.key.set_repeat(200, 50)
+        # the recordings are closed even when the window is closed (sys.exit)
+        try:
+            while running:
+                for event in pg.event.get():
+                    # fermeture de la fenêtre
+                    if event.type == pg.QUIT:
+                        pg.quit()
+                        sys.exit()
+                    # pression sur la touche entrée pour valider le placement des joueurs
+
+                    # clic de souris
+                    elif (
+                        event.type == pg.MOUSEBUTTONDOWN
+                        and back_to_menu_button.rect.collidepoint(event.pos)
+                    ):
+                        running = False
+                        self.state = "MENU"
+
+                    elif event.type == pg.KEYDOWN:
+
+                        def act(action, actions):
+                            if action == actions:
+                                action = ACTIONS.DO_NOTHING
+                            else:
+                                action = actions
+                            return action
+
+                        if event.key == pg.K_t:
+                            simulation.map.tomato_flag = True
+                        elif event.key == pg.K_s:
+                            # the window has no up to date copy of a worker
+                            if self.param["snapshot"] and travailleur is None:
+                                sauvegarder(simulation, self.param["snapshot"])
+                        elif event.key == pg.K_h:
+                            # the overlay shows the phases timed by the profiler,
+                            # which stays on when the run is profiled
+                            hud.basculer()
+                            if hud.visible:
+                                simulation.profileur.activer()
+                            elif not int(self.param["profile"]):
+                                simulation.profileur.desactiver()
+                        elif event.key == pg.K_w:
+                            action = act(action, ACTIONS.ADDING_WALLS)
+                        elif event.key == pg.K_d:
+                            action = act(action, ACTIONS.ADDING_DOORS)
+                        elif event.key == pg.K_p:
+                            action = act(action, ACTIONS.ADDING_PLAYERS)
+                        elif event.key == pg.K_r:
+                            action = act(action, ACTIONS.ADDING_PRODUCTORS)
+                        elif event.key == pg.K_e:
+                            action = act(action, ACTIONS.ADDING_EMPTY)
+                        elif event.key == pg.K_1:
+                            action = act(action, ACTIONS.CHANGE_ATTRACTOR1)
+                        elif event.key == pg.K_2:
+                            action = act(action, ACTIONS.CHANGE_ATTRACTOR2)
+                        elif event.key == pg.K_3:
+                            action = act(action, ACTIONS.CHANGE_ATTRACTOR3)
+                        elif event.key == pg.K_4:
+                            action = act(action, ACTIONS.CHANGE_ATTRACTOR4)
+                        elif event.key == pg.K_9:
+                            classe(0, pg.key.get_mods() & pg.KMOD_SHIFT)
+                        elif event.key == pg.K_8:
+                            classe(1, pg.key.get_mods() & pg.KMOD_SHIFT)
+                        elif event.key == pg.K_7:
+                            classe(2, pg.key.get_mods() & pg.KMOD_SHIFT)
+                        elif event.key == pg.K_6:
+                            classe(3, pg.key.get_mods() & pg.KMOD_SHIFT)
+
+                        x, y = pg.mouse.get_pos()
+                        cell_x = int(x / simulation.map.echelle)
+                        cell_y = int(y / simulation.map.echelle)
+                        add(cell_x, cell_y, action)
+
+                # steps at the target rate, several between two frames if needed
+                if travailleur is None:
+                    for _ in ordonnanceur.etapes():
+                        simulation.etape(eta, mu, nu, parallel)
+                # simulation.pass_epoch()
+
+                if not ordonnanceur.image_due():
+                    ordonnanceur.attendre()
+                    continue
+
+                if travailleur is not None:
+                    stats = travailleur.lire()
+                    hud.mesurer(stats["etape"])
+                    joueurs = int(stats["joueurs"])
+                else:
+                    hud.mesurer(ordonnanceur.ticks, simulation.profileur.totaux)
+                    joueurs = len(simulation.map.agents)
+
+                # only the changed cells, the button and the texts are redrawn
+                fenetre.fill(self.colors["background"], density_rect)
+                fenetre.fill(self.colors["background"], hud_rect)
+                if travailleur is not None:
+                    rects = travailleur.dessiner(fenetre)
+                elif int(self.param["render"]):
+                    rects = simulation.draw_array(fenetre)
+                else:
+                    rects = simulation.draw_changes(fenetre, [density_rect, hud_rect])
+                back_to_menu_button.draw(fenetre)
+                rects += [back_to_menu_button.rect, density_rect, hud_rect]
+                hud_rect = hud.draw(fenetre, joueurs)
+                rects.append(hud_rect)
+
+                # Display max density
+                density_text = cache_texte.render(
+                    f"Densité maximale à cet instant: {simulation.max_density:.2f}", 36, self.colors["text"]
+                )
+                density_rect = fenetre.blit(density_text, (self.SCREEN_WIDTH - density_text.get_width() - 20, self.SCREEN_HEIGHT - 100))
+                rects.append(density_rect)
+
+                # Event handling
+                if self.handle_events([back_to_menu_button], None, None) == "Back to Menu":
+                    running = False
+                    self.state = "MENU"
+                    break
+
+                pg.display.update(rects)
+        finally:
+            if travailleur is not None:
+                travailleur.arreter()
+            if simulation.trajectoire is not None:
+                simulation.trajectoire.fermer()
+            if simulation.metriques is not None:
+                if self.param["metrics"].endswith(".csv"):
+                    simulation.metriques.vers_csv(self.param["metrics"])
+                else:
+                    simulation.metriques.vers_npz(self.param["metrics"])
+            if int(self.param["profile"]):
+                print(simulation.profileur.rapport())
+
+    def run_replay(self, fenetre: pg.Surface):
+        """Replay the trajectories recorded in the file trajectory, without
+        running the simulation:
+        - space : pause
+        - left / right : previous / next step
+        - up / down : twice faster / slower
+        - click on the bar : go to a step
+        """
+        self.update_screen_infos()
+        try:
+            trajectoire = Trajectoire(self.param["trajectory"])
+        except OSError:
+            print(f"no recording {self.param['trajectory']!r}")
+            self.state = "MENU"
+            return
+
+        taille = int(
+            min(
+                self.SCREEN_WIDTH // trajectoire.nb_colonnes,
+                (self.SCREEN_HEIGHT * 0.9) // trajectoire.nb_lignes,
+            )
+        )
+        grille_rect = pg.Rect(
+            0, 0, trajectoire.nb_colonnes * taille, trajectoire.nb_lignes * taille
+        )
+        barre = pg.Rect(20, grille_rect.bottom + 10, self.SCREEN_WIDTH - 40, 16)
+        button_width, button_height = 300, 60
+        back_to_menu_button = Button(
+            x=self.SCREEN_WIDTH // 2 - button_width // 2,
+            y=self.SCREEN_HEIGHT - button_height - 50,
+            width=button_width,
+            height=button_height,
+            text="Back to Menu",
+            color=(128, 128, 128),
+            hover_color=(34, 139, 34),
+        )
+        image = pg.Surface((trajectoire.nb_colonnes, trajectoire.nb_lignes))
+        fenetre.fill(self.colors["background"])
+
+        position = 0.0
+        vitesse = float(self.param["tps"]) or 20.0
+        pause = False
+        derniere = len(trajectoire) - 1
+        running = True
         while running:
+            dt = self.clock.tick(float(self.param["fps"])) / 1000
             for event in pg.event.get():
-                # fermeture de la fenêtre
                 if event.type == pg.QUIT:
                     pg.quit()
                     sys.exit()
-                # pression sur la touche entrée pour valider le placement des joueurs
-
-                # clic de souris
-
+                elif event.type == pg.MOUSEBUTTONDOWN:
+                    if back_to_menu_button.rect.collidepoint(event.pos):
+                        running = False
+                    elif barre.collidepoint(event.pos):
+                        position = (event.pos[0] - barre.x) / barre.width * derniere
+                elif event.type == pg.MOUSEMOTION and event.buttons[0]:
+                    if barre.collidepoint(event.pos):
+                        position = (event.pos[0] - barre.x) / barre.width * derniere
                 elif event.type == pg.KEYDOWN:
-
-                    def act(action, actions):
-                        if action == actions:
-                            action = ACTIONS.DO_NOTHING
-                        else:
-                            action = actions
-                        return action
-
-                    if event.key == pg.K_t:
-                        simulation.map.tomato_flag = True
-                    elif event.key == pg.K_w:
-                        action = act(action, ACTIONS.ADDING_WALLS)
-                    elif event.key == pg.K_d:
-                        action = act(action, ACTIONS.ADDING_DOORS)
-                    elif event.key == pg.K_p:
-                        action = act(action, ACTIONS.ADDING_PLAYERS)
-                    elif event.key == pg.K_r:
-                        action = act(action, ACTIONS.ADDING_PRODUCTORS)
-                    elif event.key == pg.K_e:
-                        action = act(action, ACTIONS.ADDING_EMPTY)
-                    elif event.key == pg.K_1:
-                        action = act(action, ACTIONS.CHANGE_ATTRACTOR1)
-                    elif event.key == pg.K_2:
-                        action = act(action, ACTIONS.CHANGE_ATTRACTOR2)
-                    elif event.key == pg.K_3:
-                        action = act(action, ACTIONS.CHANGE_ATTRACTOR3)
-                    elif event.key == pg.K_4:
-                        action = act(action, ACTIONS.CHANGE_ATTRACTOR4)
-                    elif event.key == pg.K_9:
-                        if pg.key.get_mods() & pg.KMOD_SHIFT:
-                            simulation.map.open_class(0)
-                        else:
-                            simulation.map.delete_class(0)
-                    elif event.key == pg.K_8:
-                        if pg.key.get_mods() & pg.KMOD_SHIFT:
-                            simulation.map.open_class(1)
-                        else:
-                            simulation.map.delete_class(1)
-                    elif event.key == pg.K_7:
-                        if pg.key.get_mods() & pg.KMOD_SHIFT:
-                            simulation.map.open_class(2)
-                        else:
-                            simulation.map.delete_class(2)
-                    elif event.key == pg.K_6:
-                        if pg.key.get_mods() & pg.KMOD_SHIFT:
-                            simulation.map.open_class(3)
-                        else:
-                            simulation.map.delete_class(3)
-
-                    x, y = pg.mouse.get_pos()
-                    cell_x = x // simulation.map.taille_cellule
-                    cell_y = y // simulation.map.taille_cellule
-                    add(cell_x, cell_y, action)
-            pg.display.update()
-
-            if not self.param["Parallel"] == "1":
-                simulation.apply_rules(
-                    float(self.param["eta"]), float(self.param["nu"])
-                )
-            else:
-                simulation.apply_rules_parallel(
-                    float(self.param["eta"]),
-                    float(self.param["mu"]),
-                    float(self.param["nu"]),
-                )
-            # simulation.pass_epoch()
-
-            simulation.draw(fenetre)
-            back_to_menu_button.draw(fenetre)
-
-            # Display max density
-            density_font = pg.font.Font(None, 36)
-            density_text = density_font.render(
-                f"Densité maximale à cet instant: {simulation.max_density:.2f}", True, self.colors["text"]
+                    if event.key == pg.K_SPACE:
+                        pause = not pause
+                    elif event.key == pg.K_RIGHT:
+                        position = int(position) + 1
+                    elif event.key == pg.K_LEFT:
+                        position = int(position) - 1
+                    elif event.key == pg.K_UP:
+                        vitesse *= 2
+                    elif event.key == pg.K_DOWN:
+                        vitesse /= 2
+            if not pause:
+                position += vitesse * dt
+            position = min(max(position, 0), derniere)
+            etape = int(position)
+
+            pg.surfarray.blit_array(image, trajectoire.couleurs(etape))
+            pg.transform.scale(image, grille_rect.size, fenetre.subsurface(grille_rect))
+
+            fenetre.fill((200, 200, 200), barre)
+            avance = barre.copy()
+            avance.width = round(barre.width * etape / max(derniere, 1))
+            fenetre.fill(self.colors["button"], avance)
+            texte_rect = pg.Rect(20, barre.bottom + 5, self.SCREEN_WIDTH // 2 - 170, 30)
+            fenetre.fill(self.colors["background"], texte_rect)
+            texte = cache_texte.render(
+                f"étape {etape} / {derniere}   x{vitesse:g}" + ("   pause" if pause else ""),
+                30,
+                self.colors["text"],
             )
-            fenetre.blit(density_text, (self.SCREEN_WIDTH - density_text.get_width() - 20, self.SCREEN_HEIGHT - 100))
-
-            # Event handling
-            if self.handle_events([back_to_menu_button], None, None) == "Back to Menu":
-                running = False
-                self.state = "MENU"
-                break
+            fenetre.blit(texte, texte_rect)
+            back_to_menu_button.draw(fenetre)
+            pg.display.update([grille_rect, barre, texte_rect, back_to_menu_button.rect])
 
-            pg.time.delay(50)
-            pg.display.update()
+        self.state = "MENU"
 
     def jouer(self):
         """fonction principale qui gère le passage entre le menu et la simulation"""
@@ -558,6 +839,9 @@ class Game:
             if self.state == "MENU":
                 self.menu(fenetre)
 
+            elif self.state == "Replay":
+                self.run_replay(fenetre)
+
             else:
                 self.run_simulation(fenetre)
 
@@ -0,0 +1,135 @@
+import numpy as np
+
+
+class TableAgents:
+    """
+    class that stores the players of a grid as parallel arrays
+
+    A player is a row of the table, its id is the index of the row.
+    Rows of the players that left the grid are reused by the next players.
+
+    attributes:
+
+    - x : np.array : x position of the players
+    - y : np.array : y position of the players
+    - classe : np.array : class of the players
+    - inertie : np.array : inertia of the players
+    - vivant : np.array : True if the row holds a player on the grid
+    - historique : np.array : ring of the last positions (x * nb_lignes + y)
+    - tete : np.array : number of positions pushed in the ring
+    - wanna_go : np.array : position the player wants to go to (-1 if none)
+    - variante : np.array : image of the player in tomato mode
+    - replique : np.array : replica of the player in an Ensemble (0 otherwise)
+    - identifiant : np.array : number of the player among all the players
+      added, unlike its id it is never reused
+    - taille : int : number of rows used (alive or not)
+    - ajoutes : int : number of players added
+    - arrivees : int : number of players that reached a door
+    - produits : int : number of players added by the productors
+    - conflits : int : number of moves refused on a contested cell
+
+    methods:
+
+    - ajouter : add a player and return its id
+    - retirer : remove a player
+    - retirer_groupe : remove several players at once
+    - pousser_historique : push a position in the ring of a player
+    - dernieres_positions : get the last positions of a player
+    - vivants : get the ids of the players on the grid
+
+    """
+
+    HISTORIQUE = 20
+    COLONNES = (
+        "x",
+        "y",
+        "classe",
+        "inertie",
+        "vivant",
+        "historique",
+        "tete",
+        "wanna_go",
+        "variante",
+        "replique",
+        "identifiant",
+    )
+
+    def __init__(self, nb_lignes, capacite=64):
+        self.nb_lignes = nb_lignes
+        self.taille = 0
+        self.ajoutes = 0
+        self.arrivees = 0
+        self.produits = 0
+        self.conflits = 0
+        self._libres = []
+        self.x = np.zeros(capacite, np.int32)
+        self.y = np.zeros(capacite, np.int32)
+        self.classe = np.zeros(capacite, np.int8)
+        self.inertie = np.zeros(capacite, np.int32)
+        self.vivant = np.zeros(capacite, bool)
+        self.historique = np.full((capacite, self.HISTORIQUE), -1, np.int32)
+        self.tete = np.zeros(capacite, np.int32)
+        self.wanna_go = np.full(capacite, -1, np.int32)
+        self.variante = np.zeros(capacite, np.int8)
+        self.replique = np.zeros(capacite, np.int32)
+        self.identifiant = np.zeros(capacite, np.int64)
+
+    def __len__(self):
+        return self.taille - len(self._libres)
+
+    def _agrandir(self):
+        capacite = 2 * len(self.x)
+        for nom in self.COLONNES:
+            ancien = getattr(self, nom)
+            nouveau = np.zeros((capacite,) + ancien.shape[1:], ancien.dtype)
+            nouveau[: len(ancien)] = ancien
+            setattr(self, nom, nouveau)
+
+    def ajouter(self, x, y, classe, variante=0, replique=0) -> int:
+        if self._libres:
+            id = self._libres.pop()
+        else:
+            if self.taille == len(self.x):
+                self._agrandir()
+            id = self.taille
+            self.taille += 1
+        self.x[id] = x
+        self.y[id] = y
+        self.classe[id] = classe
+        self.inertie[id] = 0
+        self.vivant[id] = True
+        self.historique[id] = -1
+        self.tete[id] = 0
+        self.wanna_go[id] = -1
+        self.variante[id] = variante
+        self.replique[id] = replique
+        self.identifiant[id] = self.ajoutes
+        self.ajoutes += 1
+        return id
+
+    def retirer(self, id):
+        if self.vivant[id]:
+            self.vivant[id] = False
+            self._libres.append(int(id))
+
+    def retirer_groupe(self, ids):
+        """remove the players ids (np.array), as retirer for each of them"""
+        ids = ids[self.vivant[ids]]
+        self.vivant[ids] = False
+        self._libres.extend(ids.tolist())
+
+    def pousser_historique(self, id, x, y):
+        self.historique[id, self.tete[id] % self.HISTORIQUE] = x * self.nb_lignes + y
+        self.tete[id] += 1
+
+    def dernieres_positions(self, id):
+        """positions of the ring of a player, from the oldest to the newest"""
+        tete = int(self.tete[id])
+        n = min(tete, self.HISTORIQUE)
+        return [
+            divmod(int(self.historique[id, k % self.HISTORIQUE]), self.nb_lignes)
+            for k in range(tete - n, tete)
+        ]
+
+    def vivants(self) -> np.array:
+        return np.flatnonzero(self.vivant[: self.taille])
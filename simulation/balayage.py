@@ -0,0 +1,148 @@
+"""
+Parameter sweep of the crowd simulation
+
+This module runs the headless simulation (see Simulation with fenetre=None)
+for every combination of a grid of parameters, several times each, over a
+process pool, and gathers a summary of every run in one table.
+
+The parameters have the names of Game.param:
+
+    from simulation.balayage import balayage, tableau
+
+    lignes = balayage({"eta": [5, 10], "mu": [0.3, 0.7]}, replicats=10)
+    tableau(lignes).groupby(["eta", "mu"]).mean()
+"""
+
+import itertools
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from simulation.simulation import Simulation
+
+
+# values of the parameters that are not swept, as in the menu of game.py
+PARAMETRES = {
+    "colonnes": 60,
+    "lignes": 30,
+    "eta": 10,
+    "Parallel": 2,
+    "mu": 0.5,
+    "nu": 0.5,
+    "grad_coeff": 0.3,
+    "grad_range": 2,
+    "proba_player": 0.2,
+    "proba_wall": 0.05,
+    "classes": 1,
+    "Productor": 0,
+    "coeff_prod": 0.05,
+    "exit": 1,
+    "change_place": 0,
+    "Diff": 0,
+    "Decay": 0,
+    "change_class": 0.001,
+    "geodesic": 0,
+}
+
+
+def simuler(parametres, graine, nb_etapes=1000):
+    """run one simulation and return its summary
+
+    - evacuation : step at which the last player left (None if some remain)
+    - debit : players that reached a door per step
+    - densite_max : max over the steps of the max density of the grid
+    """
+    if nb_etapes <= 0:
+        raise ValueError(f"nb_etapes must be positive, not {nb_etapes}")
+    p = dict(PARAMETRES, **parametres)
+    # the setup draws with the random modules, the steps with Grille.rng
+    random.seed(graine)
+    np.random.seed(graine)
+    simulation = Simulation(
+        None,
+        int(p["colonnes"]),
+        int(p["lignes"]),
+        float(p["proba_wall"]),
+        float(p["proba_player"]),
+        int(p["classes"]),
+        bool(int(p["Productor"])),
+        float(p["coeff_prod"]),
+        bool(int(p["exit"])),
+        float(p["change_place"]),
+        float(p["Diff"]),
+        float(p["Decay"]),
+        change_class=float(p["change_class"]),
+        seed=graine,
+        geodesique=bool(int(p["geodesic"])),
+    )
+    simulation.random_setup()
+    grille = simulation.map
+    grille.gradient_obstacle(float(p["grad_coeff"]), int(p["grad_range"]))
+    eta, mu, nu = float(p["eta"]), float(p["mu"]), float(p["nu"])
+
+    depart = len(grille.agents)
+    evacuation = None
+    densite_max = grille.recuperer_max_densite_grille()[0]
+    etapes = 0
+    while etapes < nb_etapes:
+        simulation.etape(eta, mu, nu, int(p["Parallel"]))
+        etapes += 1
+        densite_max = max(densite_max, grille.recuperer_max_densite_grille()[0])
+        if len(grille.agents) == 0 and not grille.productor:
+            evacuation = etapes
+            break
+
+    return {
+        "graine": graine,
+        "etapes": etapes,
+        "joueurs": depart,
+        "restants": len(grille.agents),
+        "arrivees": grille.agents.arrivees,
+        "evacuation": evacuation,
+        "debit": grille.agents.arrivees / etapes,
+        "densite_max": densite_max,
+    }
+
+
+def _executer(tache):
+    parametres, replicat, graine, nb_etapes = tache
+    ligne = dict(parametres, replicat=replicat)
+    ligne.update(simuler(parametres, graine, nb_etapes))
+    return ligne
+
+
+def combinaisons(grille):
+    """every combination of the values of a grid {parameter: values}"""
+    noms = list(grille)
+    return [dict(zip(noms, valeurs)) for valeurs in itertools.product(*grille.values())]
+
+
+def balayage(grille, replicats=1, nb_etapes=1000, graine=0, processus=None):
+    """summaries of replicats runs of every combination of the grid
+
+    The runs are spread over processus worker processes (all the cores by
+    default). Every run has its own seed, drawn from the SeedSequence graine, so the table
+    does not depend on the number of processes.
+    """
+    # checked before starting the pool rather than in every worker
+    if nb_etapes <= 0:
+        raise ValueError(f"nb_etapes must be positive, not {nb_etapes}")
+    configurations = combinaisons(grille)
+    graines = iter(
+        np.random.SeedSequence(graine).generate_state(len(configurations) * replicats)
+    )
+    taches = [
+        (parametres, replicat, int(next(graines)), nb_etapes)
+        for parametres in configurations
+        for replicat in range(replicats)
+    ]
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        return list(pool.map(_executer, taches, chunksize=max(1, len(taches) // 64)))
+
+
+def tableau(lignes):
+    """the rows of balayage as a pandas DataFrame"""
+    import pandas as pd
+
+    return pd.DataFrame(lignes)
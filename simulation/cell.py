@@ -1,7 +1,7 @@
-import math
 import numpy as np
 import pygame as pg
 from enum import Enum
+from style.text_cache import cache_texte
 
 
 class TYPE_CELL(Enum):
@@ -15,26 +15,54 @@ class TYPE_CELL(Enum):
     ATTRACTOR3 = 7
     ATTRACTOR4 = 8
 
+
+# TYPE_CELL indexed by value, to decode the int8 state plane of the grid
+ETATS = tuple(TYPE_CELL)
+
+# colours of the states (indexed by value) then of the players of every class
+# (indexed by len(TYPE_CELL) + classe), as drawn by Cell.draw
+PALETTE = np.array(
+    [
+        (255, 255, 255),
+        (0, 0, 0),
+        (165, 42, 42),
+        (200, 200, 200),
+        (0, 255, 0),
+        (0, 255, 255),
+        (0, 255, 255),
+        (0, 255, 255),
+        (0, 255, 255),
+        (255, 0, 0),
+        (0, 0, 255),
+        (0, 255, 0),
+        (255, 255, 0),
+    ],
+    np.uint8,
+)
+
+
 class Cell:
     """
     class that represents a cell in the grid
 
+    A cell is a thin view over the arrays of its grid: it only stores its
+    position, every other attribute is read from and written to the grid.
+
     attributes:
 
     - x : int : x position of the cell
     - y : int : y position of the cell
-    - taille : int : size of the cell
     - grille : Grille : the grid the cell belongs to
-    - distance : list : list of distances to the different classes
+    - taille : int : size of the cell
+    - distance : np.array : distances to the different classes
     - current_state : TYPE_CELL : current state of the cell
     - player : Player : player on the cell
-    - inertie : int : inertia of the player on the cell
 
 
     methods:
 
-    - regles_de_comportement : apply the rules of the simulation
-    - empty : set the cell to empty
+    - empty : set the cell to empty, the player on it leaves the grid
+    - liberer : set the cell to empty when its player moved away
     - set_wall : set the cell to wall
     - set_door : set the cell to door
     - is_occuped : check if the cell is occuped
@@ -49,49 +77,89 @@ class Cell:
 
     """
 
-    def __init__(self, x, y, taille, grille):
+    __slots__ = ("x", "y", "grille")
+
+    def __init__(self, x, y, grille):
         self.x = x
         self.y = y
-        self.taille = taille
         self.grille = grille
-        self.distance = np.array(
-            [
-                math.sqrt((grille.x0[i] - x) ** 2 + (grille.y0[i] - y) ** 2)
-                for i in range(len(grille.x0))
-            ]
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Cell)
+            and self.x == other.x
+            and self.y == other.y
+            and self.grille is other.grille
         )
-        self.current_state = TYPE_CELL.VIDE
-        self.player = None
-        self.inertie = 0
+
+    def __hash__(self):
+        return hash((self.x, self.y))
+
+    @property
+    def taille(self):
+        return self.grille.taille_cellule
+
+    @property
+    def distance(self):
+        return self.grille.distances[:, self.x, self.y]
+
+    @property
+    def current_state(self):
+        return ETATS[self.grille.etats[self.x, self.y]]
+
+    @current_state.setter
+    def current_state(self, etat):
+        self.grille.set_etat(self.x, self.y, etat)
+
+    @property
+    def player(self):
+        return self.grille.joueur(self.grille.occupant[self.x, self.y])
+
+    @player.setter
+    def player(self, player):
+        self.grille.occupant[self.x, self.y] = -1 if player is None else player.id
+
+    @player.deleter
+    def player(self):
+        self.grille.occupant[self.x, self.y] = -1
 
     def empty(self):
+        occupant = self.grille.occupant[self.x, self.y]
+        if occupant >= 0:
+            # the player is removed, otherwise it keeps stepping from a cell
+            # that is no longer its own
+            self.grille.agents.retirer(occupant)
+        self.liberer()
+
+    def liberer(self):
         self.current_state = TYPE_CELL.VIDE
-        self.joueur = None
+        self.player = None
 
-    def set_wall(self):
-        if self.current_state == TYPE_CELL.OCCUPED:
+    def _vider_joueur(self):
+        """remove the player on the cell before it changes, if any"""
+        if self.grille.occupant[self.x, self.y] >= 0:
             self.empty()
+
+    def set_wall(self):
+        self._vider_joueur()
         self.current_state = TYPE_CELL.MUR
 
     def set_door(self):
-        if self.current_state == TYPE_CELL.OCCUPED:
-            self.empty()
+        self._vider_joueur()
         self.current_state = TYPE_CELL.PORTE
 
     def set_productor(self):
-        if self.current_state == TYPE_CELL.OCCUPED:
-            self.empty()
+        self._vider_joueur()
         self.current_state = TYPE_CELL.PRODUCTOR
 
     def change_attractor(self, nb_attract):
-        if self.current_state == TYPE_CELL.OCCUPED:
-            self.empty()
+        self._vider_joueur()
         self.grille.cellule(
             self.grille.x0[nb_attract], self.grille.y0[nb_attract]
         ).empty()
         self.grille.x0[nb_attract] = self.x
         self.grille.y0[nb_attract] = self.y
-        self.grille.change_distance(self.grille.x0, self.grille.y0)
+        self.grille.change_distance(self.grille.x0, self.grille.y0, [nb_attract])
         match nb_attract:
             case 0:
                 self.current_state = TYPE_CELL.ATTRACTOR1
@@ -283,8 +351,7 @@ class Cell:
                         self.taille,
                     ),
                 )
-                font = pg.font.Font(None, 36)
-                text = font.render("1", True, (0, 0, 0))
+                text = cache_texte.render("1", 36, (0, 0, 0))
                 fenetre.blit(
                     text,
                     (
@@ -305,8 +372,7 @@ class Cell:
                         self.taille,
                     ),
                 )
-                font = pg.font.Font(None, 36)
-                text = font.render("2", True, (0, 0, 0))
+                text = cache_texte.render("2", 36, (0, 0, 0))
                 fenetre.blit(
                     text,
                     (
@@ -327,8 +393,7 @@ class Cell:
                         self.taille,
                     ),
                 )
-                font = pg.font.Font(None, 36)
-                text = font.render("3", True, (0, 0, 0))
+                text = cache_texte.render("3", 36, (0, 0, 0))
                 fenetre.blit(
                     text,
                     (
@@ -349,8 +414,7 @@ class Cell:
                         self.taille,
                     ),
                 )
-                font = pg.font.Font(None, 36)
-                text = font.render("4", True, (0, 0, 0))
+                text = cache_texte.render("4", 36, (0, 0, 0))
                 fenetre.blit(
                     text,
                     (
@@ -0,0 +1,152 @@
+import numpy as np
+from simulation.cell import TYPE_CELL
+
+
+class ChampStatique:
+    """
+    class that represents the static floor field of a grid
+
+    For every class, the field is the walking distance (number of steps
+    around the walls) to its attractor. It replaces the straight line
+    distance in Grille.distances. The cells where a wall is added or removed
+    are kept by modifier and only the region whose distance depends on them
+    is computed again by mettre_a_jour.
+
+    attributes:
+
+    - grille : Grille : the grid of the field
+    - franchissable : np.array : flat mask of the cells that are not walls
+    - champ : np.array : walking distances, indexed [classe, x * nb_lignes + y]
+    - modifications : list : flat positions edited since the last update
+    - a_recalculer : set : classes whose attractor moved since the last update
+
+    methods:
+
+    - modifier : record a cell where a wall is added or removed
+    - deplacer_attracteur : record that the attractor of a class moved
+    - mettre_a_jour : apply the recorded edits and update Grille.distances
+
+    """
+
+    # above this number of edits, the fields are computed again from scratch
+    MAX_MODIFICATIONS = 256
+
+    def __init__(self, grille):
+        self.grille = grille
+        self.nb_lignes = grille.nb_lignes
+        self.nb_cases = grille.nb_colonnes * grille.nb_lignes
+        self.franchissable = None
+        self.champ = None
+        self.modifications = []
+        self.a_recalculer = set()
+
+    def modifier(self, x, y):
+        self.modifications.append(x * self.nb_lignes + y)
+
+    def deplacer_attracteur(self, classes):
+        self.a_recalculer.update(classes)
+
+    def mettre_a_jour(self):
+        grille = self.grille
+        if self.champ is None or len(self.modifications) > self.MAX_MODIFICATIONS:
+            self.franchissable = grille.etats.ravel() != TYPE_CELL.MUR.value
+            self.champ = np.empty((len(grille.x0), self.nb_cases))
+            classes = range(len(grille.x0))
+            for k in classes:
+                self._calculer(k)
+        else:
+            classes = set(self.a_recalculer)
+            autres = [k for k in range(len(grille.x0)) if k not in classes]
+            etats = grille.etats.ravel()
+            for position in dict.fromkeys(self.modifications):
+                franchissable = etats[position] != TYPE_CELL.MUR.value
+                if franchissable == self.franchissable[position]:
+                    continue
+                self.franchissable[position] = franchissable
+                for k in autres:
+                    if franchissable:
+                        self._liberer(k, position)
+                    else:
+                        self._bloquer(self.champ[k], position)
+                classes.update(autres)
+            for k in self.a_recalculer:
+                self._calculer(k)
+        self.modifications.clear()
+        self.a_recalculer.clear()
+
+        # unreachable cells are farther than any walking distance
+        for k in classes:
+            champ = self.champ[k].reshape(grille.nb_colonnes, grille.nb_lignes)
+            np.copyto(grille.distances[k], np.where(np.isfinite(champ), champ, self.nb_cases))
+
+    def _voisins(self, positions):
+        """flat positions (n, 4) of the neighbours and the mask of the walkable ones"""
+        L = self.nb_lignes
+        y = positions % L
+        voisins = positions[:, None] + np.array([-1, 1, -L, L])
+        dedans = np.stack(
+            [y > 0, y < L - 1, positions >= L, positions < self.nb_cases - L], axis=1
+        )
+        voisins = np.where(dedans, voisins, 0)
+        return voisins, dedans & self.franchissable[voisins]
+
+    def _relacher(self, champ, depart):
+        """propagate the distances from the cells depart to the walkable cells"""
+        frontiere = np.unique(depart)
+        while len(frontiere):
+            voisins, valides = self._voisins(frontiere)
+            candidats = np.broadcast_to(champ[frontiere, None] + 1, voisins.shape)
+            voisins, candidats = voisins[valides], candidats[valides]
+            meilleur = candidats < champ[voisins]
+            voisins, candidats = voisins[meilleur], candidats[meilleur]
+            np.minimum.at(champ, voisins, candidats)
+            frontiere = np.unique(voisins)
+
+    def _source(self, k):
+        return self.grille.x0[k] * self.nb_lignes + self.grille.y0[k]
+
+    def _calculer(self, k):
+        """an attractor covered by a wall reaches no cell"""
+        champ = self.champ[k]
+        champ.fill(np.inf)
+        source = self._source(k)
+        if self.franchissable[source]:
+            champ[source] = 0
+            self._relacher(champ, [source])
+
+    def _bloquer(self, champ, position):
+        """a wall is added: the cells whose every shortest path goes through it
+        are forgotten, then reached again from the border of that region"""
+        if not np.isfinite(champ[position]):
+            return
+        region = np.zeros(self.nb_cases, bool)
+        region[position] = True
+        frontiere = np.array([position])
+        perdues = [frontiere]
+        while len(frontiere):
+            voisins, valides = self._voisins(frontiere)
+            valides &= champ[voisins] == champ[frontiere, None] + 1
+            suivants = np.unique(voisins[valides])
+            suivants = suivants[~region[suivants]]
+            appuis, valides = self._voisins(suivants)
+            valides &= ~region[appuis] & (champ[appuis] == champ[suivants, None] - 1)
+            frontiere = suivants[~valides.any(axis=1)]
+            region[frontiere] = True
+            perdues.append(frontiere)
+        perdues = np.concatenate(perdues)
+        champ[perdues] = np.inf
+
+        bord, valides = self._voisins(perdues)
+        bord = bord[valides]
+        self._relacher(champ, bord[np.isfinite(champ[bord])])
+
+    def _liberer(self, k, position):
+        """a wall is removed: the distances can only decrease from it"""
+        champ = self.champ[k]
+        voisins, valides = self._voisins(np.array([position]))
+        voisins = voisins[valides]
+        if position == self._source(k):
+            champ[position] = 0
+        elif len(voisins):
+            champ[position] = min(champ[position], champ[voisins].min() + 1)
+        self._relacher(champ, [position])
@@ -0,0 +1,89 @@
+import numpy as np
+from simulation.cell import TYPE_CELL
+
+
+class Densite:
+    """
+    class that computes the density of players on a grid
+
+    The density of a window is 10 * occupied cells / free cells (occupied or
+    empty), 0 if the window has 5 free cells or less. It is read in O(1) for
+    any window from the summed area tables of the occupied and free cells,
+    built again at the first query after the state plane of the grid changed
+    (grille.revision, counted by every write of the grid and of the engine).
+
+    attributes:
+
+    - grille : Grille : the grid of the players
+    - occupees : np.array : summed area table of the occupied cells
+    - libres : np.array : summed area table of the free cells
+
+    methods:
+
+    - invalider : forget the tables, for a state plane written directly
+    - densite : density of the windows centered on positions
+    - carte : density of the window centered on every cell
+    - max_densite : max density of the free cells and its position
+
+    """
+
+    def __init__(self, grille):
+        self.grille = grille
+        self.occupees = None
+        self.libres = None
+        self._max = {}
+        self._revision = None
+
+    def invalider(self):
+        self._revision = None
+
+    def _verifier(self):
+        """build the tables again if the grid changed since they were built"""
+        if self._revision != self.grille.revision:
+            self._construire()
+            self._max.clear()
+            self._revision = self.grille.revision
+
+    @staticmethod
+    def _table(masque):
+        table = np.zeros((masque.shape[0] + 1, masque.shape[1] + 1), np.int32)
+        np.cumsum(masque, axis=0, out=table[1:, 1:])
+        np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+        return table
+
+    def _construire(self):
+        occupees = self.grille.etats == TYPE_CELL.OCCUPED.value
+        self.occupees = self._table(occupees)
+        self.libres = self._table(occupees | (self.grille.etats == TYPE_CELL.VIDE.value))
+
+    def _somme(self, table, x, y, size):
+        width = size // 2
+        x0 = np.clip(x - width, 0, self.grille.nb_colonnes)
+        x1 = np.clip(x + width + 1, 0, self.grille.nb_colonnes)
+        y0 = np.clip(y - width, 0, self.grille.nb_lignes)
+        y1 = np.clip(y + width + 1, 0, self.grille.nb_lignes)
+        return table[x1, y1] - table[x0, y1] - table[x1, y0] + table[x0, y0]
+
+    def densite(self, x, y, size=5):
+        self._verifier()
+        occupees = self._somme(self.occupees, x, y, size)
+        libres = self._somme(self.libres, x, y, size)
+        return np.where(libres > 5, 10 * occupees / np.maximum(libres, 1), 0)
+
+    def carte(self, size=5):
+        x = np.arange(self.grille.nb_colonnes)[:, None]
+        y = np.arange(self.grille.nb_lignes)[None, :]
+        return self.densite(x, y, size)
+
+    def max_densite(self, size=7):
+        """first maximum in the order of the columns, as the scan of the grid"""
+        self._verifier()
+        if size not in self._max:
+            carte = self.carte(size)
+            libres = (self.grille.etats == TYPE_CELL.OCCUPED.value) | (
+                self.grille.etats == TYPE_CELL.VIDE.value
+            )
+            carte[~libres] = 0
+            position = np.unravel_index(np.argmax(carte), carte.shape)
+            self._max[size] = (float(carte[position]), tuple(map(int, position)))
+        return self._max[size]
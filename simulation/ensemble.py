@@ -0,0 +1,152 @@
+import numpy as np
+from simulation.agents import TableAgents
+from simulation.cell import TYPE_CELL
+from simulation.grille import Grille
+from simulation import moteur
+
+
+class Ensemble:
+    """
+    class that steps several replicas of a grid together
+
+    The replicas start from the same grid (same walls, doors, players and
+    parameters) and then evolve independently: the state planes have a
+    leading axis of replicas and all the players are rows of one agent table,
+    so that one vectorized step (moteur.etape) advances every replica. The
+    distances and the gradient of the obstacles are shared, every replica
+    draws its random numbers from its own stream.
+
+    attributes:
+
+    - repliques : int : number of replicas
+    - etats : np.array : int8 planes of the TYPE_CELL values, indexed [r, x, y]
+    - occupant : np.array : int32 planes of the player ids, indexed [r, x, y]
+    - revision : int : number of writes to the state planes (as Grille)
+    - revision_decor : int : number of changes of the static cells (as Grille)
+    - agents : TableAgents : players of all the replicas (agents.replique)
+    - distances : np.array : distances to the attractors of the grid
+    - grad_matrix : np.array : gradient of the obstacles of the grid
+    - Dynamic_Field : np.array : dynamic field, indexed [classe, r, x, y]
+    - zone_champ : tuple : box out of which Dynamic_Field is 0 (or None)
+    - generateurs : list : random generator of every replica
+    - productor : list : positions of the productors
+
+    methods:
+
+    - tirage : draw random numbers for some players
+    - deposer_champ : add to the dynamic field at some positions
+    - diffusion_Field : diffuse and decay the dynamic field
+    - ajouter_joueur : add a player in a replica
+    - etape : apply the parallel rules to all the replicas
+    - joueurs : number of players of every replica
+
+    """
+
+    SEUIL_CHAMP = Grille.SEUIL_CHAMP
+
+    # the field methods of Grille work on the field with an axis of replicas
+    deposer_champ = Grille.deposer_champ
+    diffusion_Field = Grille.diffusion_Field
+
+    def __init__(self, grille: Grille, repliques, seed=None):
+        self.repliques = repliques
+        self.nb_colonnes = grille.nb_colonnes
+        self.nb_lignes = grille.nb_lignes
+        self.x0 = grille.x0
+        self.y0 = grille.y0
+        self.productor = list(grille.productor)
+        self.change_place = grille.change_place
+        self.change_class = grille.change_class
+        self.exit = grille.exit
+        self.Diff = grille.Diff
+        self.decay = grille.decay
+
+        grille.mettre_a_jour_champ()
+        self.distances = grille.distances
+        self.grad_matrix = grille.grad_matrix
+
+        self.etats = np.repeat(grille.etats[None], repliques, axis=0)
+        n = grille.agents.taille
+        decalage = (np.arange(repliques, dtype=np.int32) * n)[:, None, None]
+        self.occupant = np.where(
+            grille.occupant >= 0, grille.occupant + decalage, -1
+        ).astype(np.int32)
+        self.revision = 0
+        self.revision_decor = 0
+
+        # the rows of the player i of the replica r is r * n + i
+        self.agents = TableAgents(self.nb_lignes, max(repliques * n, 1))
+        for nom in TableAgents.COLONNES:
+            colonne = getattr(grille.agents, nom)[:n]
+            getattr(self.agents, nom)[: repliques * n] = np.tile(
+                colonne, (repliques,) + (1,) * (colonne.ndim - 1)
+            )
+        self.agents.replique[: repliques * n] = np.repeat(np.arange(repliques), n)
+        self.agents.taille = repliques * n
+        self.agents.ajoutes = grille.agents.ajoutes
+        self.agents._libres = [
+            r * n + id for r in range(repliques) for id in grille.agents._libres
+        ]
+
+        self.Dynamic_Field = np.repeat(grille.Dynamic_Field[:, None], repliques, axis=1)
+        self._champ_suivant = None
+        self.zone_champ = grille.zone_champ
+
+        self.generateurs = [
+            np.random.default_rng(graine)
+            for graine in np.random.SeedSequence(seed).spawn(repliques)
+        ]
+
+    def tirage(self, ids, n=None):
+        """uniform draws for the players ids, from the streams of their replicas"""
+        forme = () if n is None else (n,)
+        repliques = self.agents.replique[ids]
+        ordre = np.argsort(repliques, kind="stable")
+        nombres = np.bincount(repliques, minlength=self.repliques)
+        tirages = np.empty((len(ids),) + forme)
+        tirages[ordre] = np.concatenate(
+            [
+                generateur.random((nombre,) + forme)
+                for generateur, nombre in zip(self.generateurs, nombres)
+            ]
+        )
+        return tirages
+
+    def decay_Field(self):
+        pass
+
+    def ajouter_joueur(self, r, x, y):
+        """add a player in the replica r, as Grille.add_player"""
+        match self.etats[r, x, y]:
+            case TYPE_CELL.VIDE.value:
+                self.etats[r, x, y] = TYPE_CELL.OCCUPED.value
+            case TYPE_CELL.PRODUCTOR.value:
+                self.agents.produits += 1
+            case _:
+                return
+        generateur = self.generateurs[r]
+        self.occupant[r, x, y] = self.agents.ajouter(
+            x,
+            y,
+            generateur.integers(len(self.x0)),
+            generateur.integers(2),
+            replique=r,
+        )
+
+    def etape(self, eta, mu, nu, coeff_prod=0):
+        """apply the parallel rules to all the replicas, as
+        Simulation.apply_rules_vectorized"""
+        if self.Diff != 0:
+            self.decay_Field()
+            self.diffusion_Field()
+
+        moteur.etape(self, eta, mu, nu)
+        for r, generateur in enumerate(self.generateurs):
+            for x, y in self.productor:
+                if generateur.random() < coeff_prod:
+                    self.ajouter_joueur(r, x, y)
+
+    def joueurs(self) -> np.array:
+        """number of players on the grid of every replica"""
+        ids = self.agents.vivants()
+        return np.bincount(self.agents.replique[ids], minlength=self.repliques)
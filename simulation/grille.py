@@ -1,10 +1,12 @@
 from simulation.cell import Cell, TYPE_CELL
 from simulation.player import Player
+from simulation.agents import TableAgents
+from simulation.champ_statique import ChampStatique
+from simulation.densite import Densite
 import pygame as pg
 import numpy as np
-import math
 import random
-from scipy.signal import convolve2d
+from scipy.signal import convolve
 
 class Grille:
     """
@@ -14,26 +16,48 @@ class Grille:
 
     - x0 : list : x position of the classes
     - y0 : list : y position of the classes
-    - fenetre : pg.Surface : surface of the window
+    - fenetre : pg.Surface : surface of the window (None when headless)
     - porte : list : list of positions of the doors
     - mur : list : list of positions of the walls
     - nb_colonnes : int : number of columns
     - nb_lignes : int : number of rows
     - x0 : list : x position of the classes
     - y0 : list : y position of the classes
-    - taille_cellule : int : size of the cell
-    - grille : list : list of cells
-    - players : list : list of players
+    - taille_cellule : int : size of the cell (1 when headless, 0 when the
+      grid is larger than the window)
+    - echelle : float : size of the cell in pixels, a fraction of pixel when
+      the grid is larger than the window (drawn by Simulation.draw_array)
+    - etats : np.array : int8 plane of the TYPE_CELL values, indexed [x, y]
+    - occupant : np.array : int32 plane of the player ids (-1 if no player)
+    - distances : np.array : distances to the attractors, indexed [classe, x, y]
+    - agents : TableAgents : table of the players, indexed by their id
+    - players : list : accessors over the players on the grid
     - productor : list : list of productors
     - attractor : list : list of attractors
     - tomato_flag : bool : flag to know if the simulation is in tomato mode
     - change_place : float : probability to change place with another player
     - grad_matrix : np.array : gradient matrix
+    - noyau_obstacle : np.array : weights of a wall in grad_matrix (None
+      until gradient_obstacle is called)
     - exit : bool : if the simulation has an exit
+    - rng : np.random.Generator : random generator of the vectorized engine
+    - revision : int : number of writes to the state plane, the density is
+      built again when it changes
+    - revision_decor : int : number of changes of the static cells (walls,
+      doors, productors, attractors), the recordings copy them when it changes
+    - densite : Densite : density of the players
+    - champ_statique : ChampStatique : walking distances used instead of the
+      straight line distances (None if not geodesique)
+    - Dynamic_Field : np.array : dynamic field of the classes, indexed
+      [classe, x, y] (float32 if champ_float32)
+    - zone_champ : tuple : (x0, x1, y0, y1) box out of which Dynamic_Field is
+      0 (None if the field is 0 everywhere)
 
     methods:
 
     - cellule : get a cell at a position
+    - set_etat : set the state of a position
+    - joueur : get a player from its id
     - ajouter_mur : add a wall at a position
     - ajouter_porte : add a door at a position
     - add_player : add a player at a position
@@ -42,13 +66,20 @@ class Grille:
     - draw : draw the grid on the screen
     - gradient_obstacle : get the gradient of the obstacles
     - show_gradient : show the gradient on the screen
-    - change_distance : change the distance of the players
+    - change_distance : update the distances to the attractors of some classes
+    - mettre_a_jour_champ : update the walking distances after edits
     - delete_class : delete a class of players
     - open_class : open a class of players
     - add_productor : add a productor at a position
+    - tirage : draw random numbers for some players
+    - deposer_champ : add to the dynamic field at some positions
+    - diffusion_Field : diffuse and decay the dynamic field of every class
 
     """
 
+    # below this value, the dynamic field is considered decayed
+    SEUIL_CHAMP = 1e-4
+
     def __init__(
         self,
         x0,
@@ -67,27 +98,50 @@ class Grille:
         Diff=0,
         Decay=0,
         show_gradient = False,
-        change_class = 0.001
+        change_class = 0.001,
+        seed=None,
+        geodesique=False,
+        champ_float32=False,
     ):
-        screen_info = pg.display.Info()
-        self.SCREEN_WIDTH = screen_info.current_w
-        self.SCREEN_HEIGHT = screen_info.current_h
+        if fenetre is None:
+            # headless: no display to size the cells
+            self.SCREEN_WIDTH = self.SCREEN_HEIGHT = 0
+        else:
+            screen_info = pg.display.Info()
+            self.SCREEN_WIDTH = screen_info.current_w
+            self.SCREEN_HEIGHT = screen_info.current_h
         self.fenetre = fenetre
 
         self.nb_colonnes = nb_colonnes
         self.nb_lignes = nb_lignes
         self.grad_matrix = np.zeros((nb_colonnes, nb_lignes))
+        self.noyau_obstacle = None
         self.x0 = x0
         self.y0 = y0
-        self.taille_cellule = min(
-            self.SCREEN_WIDTH // nb_colonnes, (self.SCREEN_HEIGHT * 0.9) // nb_lignes
+        self.taille_cellule = (
+            min(
+                self.SCREEN_WIDTH // nb_colonnes,
+                (self.SCREEN_HEIGHT * 0.9) // nb_lignes,
+            )
+            if fenetre is not None
+            else 1
+        )
+        self.echelle = self.taille_cellule or min(
+            self.SCREEN_WIDTH / nb_colonnes, self.SCREEN_HEIGHT * 0.9 / nb_lignes
         )
         self.change_place = change_place
-        self.grille = [
-            [Cell(x, y, self.taille_cellule, self) for x in range(nb_colonnes)]
-            for y in range(nb_lignes)
-        ]
-        self.players = []
+        self.etats = np.full((nb_colonnes, nb_lignes), TYPE_CELL.VIDE.value, np.int8)
+        self.occupant = np.full((nb_colonnes, nb_lignes), -1, np.int32)
+        self.revision = 0
+        self.revision_decor = 0
+        self._colonnes = np.arange(nb_colonnes, dtype=np.float64)[:, None]
+        self._lignes = np.arange(nb_lignes, dtype=np.float64)[None, :]
+        self.distances = np.zeros((len(x0), nb_colonnes, nb_lignes))
+        self.champ_statique = ChampStatique(self) if geodesique else None
+        self.change_distance(x0, y0)
+        self.agents = TableAgents(nb_lignes)
+        self.rng = np.random.default_rng(seed)
+        self.densite = Densite(self)
         self.productor = []
         self.attractor = []
         if Decay == 0:
@@ -98,13 +152,13 @@ class Grille:
         self.exit = exit
         self.change_class = change_class
         self.tomato_flag = False
-        self.Dynamic_Field = np.array(
-            [
-                [[0 for _ in range(nb_lignes)] for _ in range(nb_colonnes)]
-                for _ in range(len(x0))
-            ],
-            dtype=np.float64,
+        self.Dynamic_Field = np.zeros(
+            (len(x0), nb_colonnes, nb_lignes),
+            np.float32 if champ_float32 else np.float64,
         )
+        # buffer of diffusion_Field, allocated at the first diffusion
+        self._champ_suivant = None
+        self.zone_champ = None
         self.show_gradient = show_gradient
 
         if not porte:
@@ -129,15 +183,7 @@ class Grille:
                 ]
                 self.attractor = [(x0[z], y0[z]) for z in range(len(x0))]
             for z in range(len(x0)):
-                match z:
-                    case 0:
-                        self.grille[y0[z]][x0[z]].current_state = TYPE_CELL.ATTRACTOR1
-                    case 1:
-                        self.grille[y0[z]][x0[z]].current_state = TYPE_CELL.ATTRACTOR2
-                    case 2:
-                        self.grille[y0[z]][x0[z]].current_state = TYPE_CELL.ATTRACTOR3
-                    case 3:
-                        self.grille[y0[z]][x0[z]].current_state = TYPE_CELL.ATTRACTOR4
+                self.etats[x0[z], y0[z]] = TYPE_CELL.ATTRACTOR1.value + z
 
         else:
             self.porte = porte
@@ -151,44 +197,71 @@ class Grille:
         else:
             self.mur = mur
 
-        for x, y in self.mur:
-            self.grille[y][x].current_state = TYPE_CELL.MUR
-        for x, y in self.porte:
-            self.grille[y][x].current_state = TYPE_CELL.PORTE
-        for x, y in self.productor:
-            self.grille[y][x].current_state = TYPE_CELL.PRODUCTOR
+        for positions, etat in (
+            (self.mur, TYPE_CELL.MUR),
+            (self.porte, TYPE_CELL.PORTE),
+            (self.productor, TYPE_CELL.PRODUCTOR),
+        ):
+            if positions:
+                x_coords, y_coords = zip(*positions)
+                self.etats[list(x_coords), list(y_coords)] = etat.value
+
+    def __getstate__(self):
+        etat = self.__dict__.copy()
+        etat["fenetre"] = None
+        return etat
 
     def cellule(self, x, y) -> Cell:
-        return self.grille[int(y)][int(x)]
-
-    def gradient_obstacle(self, grad_coeff, elarg) -> np.array:
-        gradient = np.zeros((self.nb_colonnes, self.nb_lignes))
-        x_coords, y_coords = zip(*self.mur)
-        for dx in range(-elarg, elarg + 1):
-            for dy in range(-elarg, elarg + 1):
-                weight = grad_coeff / (abs(dx) + abs(dy) + 1)
-                gradient[
-                    np.clip(np.array(x_coords) + dx, 0, self.nb_colonnes - 1),
-                    np.clip(np.array(y_coords) + dy, 0, self.nb_lignes - 1),
-                ] += weight
-        self.grad_matrix = gradient
-        return gradient
+        return Cell(int(x), int(y), self)
+
+    def set_etat(self, x, y, etat: TYPE_CELL):
+        ancien = self.etats[x, y]
+        mur = ancien == TYPE_CELL.MUR.value
+        if mur != (etat == TYPE_CELL.MUR):
+            if self.champ_statique is not None:
+                self.champ_statique.modifier(x, y)
+            if self.noyau_obstacle is not None:
+                self._patch_gradient(x, y, -1 if mur else 1)
+        self.etats[x, y] = etat.value
+        self.revision += 1
+        if etat not in (TYPE_CELL.VIDE, TYPE_CELL.OCCUPED) or ancien not in (
+            TYPE_CELL.VIDE.value,
+            TYPE_CELL.OCCUPED.value,
+        ):
+            self.revision_decor += 1
+
+    def joueur(self, id):
+        return Player(self, id) if id >= 0 else None
+
+    @property
+    def players(self):
+        return [Player(self, id) for id in self.agents.vivants()]
+
+    def gradient_obstacle(self, grad_coeff, elarg=2) -> np.array:
+        """repulsion of the walls: every wall adds grad_coeff / (|dx| + |dy| + 1)
+        to the cells at most elarg columns and rows away"""
+        d = np.abs(np.arange(-elarg, elarg + 1))
+        self.noyau_obstacle = grad_coeff / (d[:, None] + d[None, :] + 1)
+        murs = self.etats == TYPE_CELL.MUR.value
+        self.grad_matrix = convolve(murs, self.noyau_obstacle, mode="same")
+        return self.grad_matrix
+
+    def _patch_gradient(self, x, y, signe):
+        """add (signe=1) or remove (signe=-1) the repulsion of a wall at x, y"""
+        e = len(self.noyau_obstacle) // 2
+        x0, x1 = max(x - e, 0), min(x + e + 1, self.nb_colonnes)
+        y0, y1 = max(y - e, 0), min(y + e + 1, self.nb_lignes)
+        self.grad_matrix[x0:x1, y0:y1] += signe * self.noyau_obstacle[
+            x0 - x + e : x1 - x + e, y0 - y + e : y1 - y + e
+        ]
 
     def ajouter_mur(self, x, y):
         cell = self.cellule(x, y)
-        if cell.is_occuped():
-            self.players.remove(cell.player)
-            del cell.player
-            cell.empty()
         self.mur.append((x, y))
         cell.set_wall()
 
     def ajouter_porte(self, x, y):
         cell = self.cellule(x, y)
-        if cell.is_occuped():
-            self.players.remove(cell.player)
-            del cell.player
-            cell.empty()
         self.porte.append((x, y))
         cell.set_door()
 
@@ -196,14 +269,16 @@ class Grille:
         cell = self.cellule(x, y)
         if cell.current_state == TYPE_CELL.VIDE:
             cell.current_state = TYPE_CELL.OCCUPED
-            player = Player(cell)
-            cell.player = player
-            self.players.append(player)
-        if cell.current_state == TYPE_CELL.PRODUCTOR:
-            player = Player(cell)
-            cell.player = player
-            self.players.append(player)
-            cell.current_state = TYPE_CELL.PRODUCTOR
+        elif cell.current_state == TYPE_CELL.PRODUCTOR:
+            self.agents.produits += 1
+        else:
+            return
+        self.occupant[cell.x, cell.y] = self.agents.ajouter(
+            cell.x,
+            cell.y,
+            random.choice(range(len(self.x0))),
+            random.randrange(2),
+        )
 
     def add_productor(self, x, y):
         cell = self.cellule(x, y)
@@ -212,14 +287,27 @@ class Grille:
             self.productor.append((x, y))
 
     def get_cellules(self):
-        return [cell for cells in self.grille for cell in cells]
+        return (
+            Cell(x, y, self)
+            for y in range(self.nb_lignes)
+            for x in range(self.nb_colonnes)
+        )
 
-    def change_distance(self, x0, y0):
-        for cell in self.get_cellules():
-            cell.distance = [
-                math.sqrt((x0[i] - cell.x) ** 2 + (y0[i] - cell.y) ** 2)
-                for i in range(len(x0))
-            ]
+    def change_distance(self, x0, y0, classes=None):
+        """update the distances to the attractors of the classes (all by default)"""
+        if classes is None:
+            classes = range(len(x0))
+        if self.champ_statique is not None:
+            # walking distances are computed by mettre_a_jour_champ
+            self.champ_statique.deplacer_attracteur(classes)
+            return
+        for k in classes:
+            np.hypot(x0[k] - self._colonnes, y0[k] - self._lignes, out=self.distances[k])
+
+    def mettre_a_jour_champ(self):
+        """apply the edits of the walls to the walking distances, if used"""
+        if self.champ_statique is not None:
+            self.champ_statique.mettre_a_jour()
 
     def recuperer_voisins(self, x, y):
         voisin_positions = [
@@ -236,68 +324,104 @@ class Grille:
         return voisins
     
     def recuperer_densite(self, x, y, size=5):
-        width = size // 2
-        voisins = [
-            (i, j)
-            for i in range(x - width, x + width + 1)
-            for j in range(y - width, y + width + 1)
-            if (0 <= i < self.nb_colonnes and 0 <= j < self.nb_lignes)
-            if self.cellule(i, j).is_occuped() or self.cellule(i, j).is_empty()
-        ]
-        if len(voisins) <= 5:
-            return 0
-        densite = sum(1 for i, j in voisins if (self.cellule(i, j).is_occuped()))
-        densite *= 10/len(voisins)
-        return densite
+        return float(self.densite.densite(x, y, size))
 
     def recuperer_max_densite_grille(self):
-        max_densite = 0
-        densite = 0
-        x_max,y_max=0,0
-        for x in range(self.nb_colonnes):
-            for y in range(self.nb_lignes):
-                if self.cellule(x, y).is_occuped() or self.cellule(x, y).is_empty():
-                    densite = self.recuperer_densite(x, y, size=7)
-                if densite > max_densite:
-                    max_densite = densite
-                    x_max, y_max=x,y
-                    if max_densite == 10:
-                        return max_densite, (x_max, y_max)
-        return max_densite, (x_max,y_max)
+        return self.densite.max_densite(size=7)
 
     def delete_class(self, classe):
-        for player in self.players:
-            while player.classe == classe:
-                player.classe = random.choice(range(len(self.x0)))
-                player.change_color()
+        autres = [k for k in range(len(self.x0)) if k != classe]
+        if not autres:
+            return
+        ids = self.agents.vivants()
+        ids = ids[self.agents.classe[ids] == classe]
+        self.agents.classe[ids] = np.random.choice(autres, len(ids))
 
     def open_class(self, classe):
-        for player in self.players:
-            if random.random() < 1 / (len(self.x0) + 1):
-                player.classe = classe
-                player.change_color()
+        ids = self.agents.vivants()
+        ids = ids[np.random.random(len(ids)) < 1 / (len(self.x0) + 1)]
+        self.agents.classe[ids] = classe
 
     def decay_Field(self):
         pass
 
+    def tirage(self, ids, n=None):
+        """uniform draws for the players ids (n per player if n is given)"""
+        return self.rng.random(len(ids) if n is None else (len(ids), n))
+
+    def deposer_champ(self, classes, positions, quantite):
+        """add quantite to the dynamic field of the classes at the flat
+        positions (x * nb_lignes + y)"""
+        if np.size(positions) == 0:
+            return
+        self.Dynamic_Field.reshape(len(self.x0), -1)[classes, positions] += quantite
+        # an Ensemble adds the offset of the replica to the positions
+        x, y = np.divmod(positions % (self.nb_colonnes * self.nb_lignes), self.nb_lignes)
+        zone = (np.min(x), np.max(x) + 1, np.min(y), np.max(y) + 1)
+        if self.zone_champ is not None:
+            ancienne = self.zone_champ
+            zone = (
+                min(zone[0], ancienne[0]),
+                max(zone[1], ancienne[1]),
+                min(zone[2], ancienne[2]),
+                max(zone[3], ancienne[3]),
+            )
+        self.zone_champ = tuple(map(int, zone))
+
     def diffusion_Field(self):
-        # Initialisation d'une copie pour éviter d'écraser les valeurs pendant le calcul
-        new_field = np.copy(self.Dynamic_Field)
-
-        # Définition du noyau de convolution pour les voisins (haut, bas, gauche, droite)
-        kernel = self.Diff * np.array(
-            [[0, 1, 0], [1, 0, 1], [0, 1, 0]]
-        )  # Ne prend en compte que les voisins directs
-        import time
-
-        # Parcourir les classes discrétisées
-        for k in range(len(self.x0)):
-            # Calcul de la somme des voisins via convolution
-            field = self.Dynamic_Field[k]
-            sum_voisins = convolve2d(field, kernel, mode="same")
-
-            # Mise à jour du champ dynamique avec l'équation de diffusion
-            new_field[k] = sum_voisins / 4 + (1 - self.decay) * self.Dynamic_Field[k]
-        new_field = new_field.clip(0, 5)
-        # Remplacement du champ par le nouveau champ mis à jour
-        self.Dynamic_Field = new_field
+        """one step of F <- Diff / 4 * (sum of the 4 neighbours) + (1 - decay) * F,
+        clipped to [0, 5], for all the classes at once
+
+        The new field is written in a second buffer that is then swapped with
+        Dynamic_Field, the old field becomes the buffer of the next step (the
+        buffer is allocated at the first call, never when Diff is 0).
+        Only the box zone_champ, grown by one cell, is computed: both buffers
+        are 0 out of it. The box is then shrunk to the cells above SEUIL_CHAMP.
+        """
+        if self.zone_champ is None:
+            return
+        x0, x1, y0, y1 = self.zone_champ
+        x0, y0 = max(x0 - 1, 0), max(y0 - 1, 0)
+        x1, y1 = min(x1 + 1, self.nb_colonnes), min(y1 + 1, self.nb_lignes)
+        # the field of an Ensemble has one more axis, the replicas
+        if self._champ_suivant is None:
+            self._champ_suivant = np.zeros_like(self.Dynamic_Field)
+        champ = self.Dynamic_Field[..., x0:x1, y0:y1]
+        suivant = self._champ_suivant[..., x0:x1, y0:y1]
+
+        # sum of the neighbours, the cells out of the box are 0
+        suivant[..., 1:, :] = champ[..., :-1, :]
+        suivant[..., 0, :] = 0
+        suivant[..., :-1, :] += champ[..., 1:, :]
+        suivant[..., 1:] += champ[..., :-1]
+        suivant[..., :-1] += champ[..., 1:]
+        suivant *= self.Diff / 4
+        champ *= 1 - self.decay
+        suivant += champ
+        np.clip(suivant, 0, 5, out=suivant)
+        self.Dynamic_Field, self._champ_suivant = (
+            self._champ_suivant,
+            self.Dynamic_Field,
+        )
+
+        actif = (suivant > self.SEUIL_CHAMP).any(axis=tuple(range(suivant.ndim - 2)))
+        colonnes = np.flatnonzero(actif.any(axis=1))
+        lignes = np.flatnonzero(actif.any(axis=0))
+        if len(colonnes) == 0:
+            self.zone_champ = None
+            suivant[:] = 0
+            champ[:] = 0
+            return
+        zone = (
+            x0 + colonnes[0],
+            x0 + colonnes[-1] + 1,
+            y0 + lignes[0],
+            y0 + lignes[-1] + 1,
+        )
+        if zone != (x0, x1, y0, y1):
+            # the decayed residues out of the new box are set to 0
+            garde = np.zeros(actif.shape, bool)
+            garde[zone[0] - x0 : zone[1] - x0, zone[2] - y0 : zone[3] - y0] = True
+            suivant[..., ~garde] = 0
+            champ[..., ~garde] = 0
+        self.zone_champ = tuple(map(int, zone))
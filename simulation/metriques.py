@@ -0,0 +1,136 @@
+import numpy as np
+
+
+class Metriques:
+    """
+    class that records values of a grid after every step, as columns
+
+    Every column is a NumPy array with a row per recorded step, allocated in
+    advance and doubled when it is full (as TableAgents), so that recording a
+    step only writes in the arrays. The counters of TableAgents (arrivees,
+    produits, conflits) are recorded by step, not cumulated.
+
+    columns:
+
+    - etape : number of the step
+    - joueurs : number of players on the grid
+    - arrivees : players that reached a door during the step
+    - produits : players added by the productors during the step
+    - conflits : moves refused on a contested cell during the step
+    - densite_max : max density of the grid (NaN if not recorded)
+    - classe_k : number of players of the class k
+
+    attributes:
+
+    - taille : int : number of recorded steps
+    - classes : int : number of classes
+    - densite : bool : the max density is recorded (it costs a density
+      computation per step when the grid is not drawn)
+    - donnees : dict : arrays of the columns, taille rows used
+
+    methods:
+
+    - commencer : count the events of a grid from now on
+    - enregistrer : record the values of a grid after a step
+    - colonnes : views of the recorded rows of the columns
+    - vers_csv : write the columns in a CSV file
+    - vers_npz : write the columns in a compressed NPZ file
+    - charger : read the columns of a NPZ file
+    - tableau : the columns as a pandas DataFrame
+
+    """
+
+    COMPTEURS = ("arrivees", "produits", "conflits")
+
+    def __init__(self, classes, capacite=1024, densite=True):
+        self.classes = classes
+        self.densite = densite
+        self.taille = 0
+        self._precedents = [0] * len(self.COMPTEURS)
+        self.donnees = {
+            "etape": np.zeros(capacite, np.int64),
+            "joueurs": np.zeros(capacite, np.int32),
+            "arrivees": np.zeros(capacite, np.int32),
+            "produits": np.zeros(capacite, np.int32),
+            "conflits": np.zeros(capacite, np.int32),
+            "densite_max": np.zeros(capacite, np.float64),
+        }
+        for k in range(classes):
+            self.donnees[f"classe_{k}"] = np.zeros(capacite, np.int32)
+        self._classes = [self.donnees[f"classe_{k}"] for k in range(classes)]
+
+    def __len__(self):
+        return self.taille
+
+    def _agrandir(self):
+        for nom, ancien in self.donnees.items():
+            nouveau = np.zeros(2 * len(ancien), ancien.dtype)
+            nouveau[: len(ancien)] = ancien
+            self.donnees[nom] = nouveau
+        self._classes = [self.donnees[f"classe_{k}"] for k in range(self.classes)]
+
+    def commencer(self, grille):
+        """count the arrivals, productions and conflicts from the current
+        values of the counters of grille (from 0 otherwise)"""
+        self._precedents = [getattr(grille.agents, nom) for nom in self.COMPTEURS]
+
+    def enregistrer(self, grille, etape=None):
+        """record the values of the grid after a step (etape: number of the
+        step, the next one by default)"""
+        if self.taille == len(self.donnees["etape"]):
+            self._agrandir()
+        i = self.taille
+        agents = grille.agents
+        donnees = self.donnees
+
+        for j, nom in enumerate(self.COMPTEURS):
+            valeur = getattr(agents, nom)
+            donnees[nom][i] = valeur - self._precedents[j]
+            self._precedents[j] = valeur
+
+        donnees["etape"][i] = (donnees["etape"][i - 1] + 1 if i else 1) if etape is None else etape
+        ids = agents.vivants()
+        donnees["joueurs"][i] = len(ids)
+        nombres = np.bincount(agents.classe[ids], minlength=self.classes)
+        for k, colonne in enumerate(self._classes):
+            colonne[i] = nombres[k]
+        donnees["densite_max"][i] = (
+            grille.recuperer_max_densite_grille()[0] if self.densite else np.nan
+        )
+        self.taille += 1
+
+    def colonnes(self) -> dict:
+        """views (no copy) of the recorded rows of every column"""
+        return {nom: colonne[: self.taille] for nom, colonne in self.donnees.items()}
+
+    def vers_csv(self, chemin):
+        colonnes = self.colonnes()
+        formats = ["%.6g" if colonne.dtype.kind == "f" else "%d" for colonne in colonnes.values()]
+        np.savetxt(
+            chemin,
+            np.column_stack(list(colonnes.values())),
+            fmt=formats,
+            delimiter=",",
+            header=",".join(colonnes),
+            comments="",
+        )
+
+    def vers_npz(self, chemin):
+        np.savez_compressed(chemin, **self.colonnes())
+
+    @classmethod
+    def charger(cls, chemin) -> "Metriques":
+        with np.load(chemin) as fichier:
+            donnees = {nom: fichier[nom] for nom in fichier.files}
+        classes = sum(nom.startswith("classe_") for nom in donnees)
+        metriques = cls(classes, capacite=max(len(donnees["etape"]), 1))
+        for nom, colonne in donnees.items():
+            metriques.donnees[nom][: len(colonne)] = colonne
+        metriques.taille = len(donnees["etape"])
+        return metriques
+
+    def tableau(self):
+        """the recorded rows as a pandas DataFrame over the arrays (not copied)"""
+        import pandas as pd
+
+        return pd.DataFrame(self.colonnes(), copy=False)
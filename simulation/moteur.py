@@ -0,0 +1,262 @@
+"""
+Vectorized step engine for the crowd simulation
+
+This module applies the parallel rules of Player.apply_rules_parallel to every
+player of a grid at once: the scores H of the four neighbours and of the
+current cell are computed in one array operation, then the softmax, the
+sampling, the exchanges and the conflicts are resolved in bulk.
+
+The candidates of a player are ordered like Grille.recuperer_voisins:
+up, down, left, right, then the current cell ("stay").
+
+The grid can also be an Ensemble of replicas: the state planes of a replica
+start at the flat offset replique * nb_colonnes * nb_lignes, the distances and
+the gradient of the obstacles are shared, and the random draws of a player
+come from the stream of its replica (grille.tirage).
+"""
+
+import numpy as np
+from simulation.cell import TYPE_CELL
+
+
+DX = np.array([0, 0, -1, 1, 0])
+DY = np.array([-1, 1, 0, 0, 0])
+RESTER = 4
+
+VIDE = TYPE_CELL.VIDE.value
+PORTE = TYPE_CELL.PORTE.value
+OCCUPED = TYPE_CELL.OCCUPED.value
+PRODUCTOR = TYPE_CELL.PRODUCTOR.value
+
+
+def decalages(grille, ids):
+    """flat offset of the replica of the players in the state planes"""
+    cases = grille.nb_colonnes * grille.nb_lignes
+    return grille.agents.replique[ids].astype(np.intp) * cases
+
+
+def candidats(grille, ids):
+    """flat positions (x * nb_lignes + y) of the 5 candidates of the players,
+    and the mask of the candidates that are inside the grid"""
+    agents = grille.agents
+    cx = agents.x[ids, None] + DX
+    cy = agents.y[ids, None] + DY
+    dedans = (cx >= 0) & (cx < grille.nb_colonnes) & (cy >= 0) & (cy < grille.nb_lignes)
+    positions = np.where(dedans, cx * grille.nb_lignes + cy, 0)
+    return positions, dedans
+
+
+def penalites_historique(grille, ids):
+    """number of times each candidate appears in the recent positions of the
+    players (the newest min(20, n) - 1 positions, as Player.inertia_and_grad)"""
+    agents = grille.agents
+    taille = agents.HISTORIQUE
+    tete = agents.tete[ids, None]
+    # the oldest position of a full ring is the next one to be overwritten
+    plus_ancien = np.where(tete >= taille, tete % taille, 0)
+    places = np.arange(taille, dtype=np.int32)
+    recent = (places < tete) & (places != plus_ancien)
+
+    # a recent position is a candidate when its offset to the player is one
+    # of the offsets of the candidates (out of grid candidates are invalid)
+    L = grille.nb_lignes
+    table = np.full(2 * L + 2, len(DX), np.intp)
+    table[DX * L + DY + L] = np.arange(len(DX))
+    ici = agents.x[ids] * L + agents.y[ids]
+    ecart = (agents.historique[ids] - (ici - L)[:, None]).view(np.uint32)
+    ecart = np.where(recent, np.minimum(ecart, 2 * L + 1), 2 * L + 1)
+    candidat = np.take(table, ecart)
+    candidat += np.arange(len(ids))[:, None] * (len(DX) + 1)
+    return np.bincount(
+        candidat.ravel(), minlength=len(ids) * (len(DX) + 1)
+    ).reshape(len(ids), -1)[:, :-1]
+
+
+def scores(grille, ids, positions, globales, dedans, etats, nu):
+    """scores H of the candidates, Player.choose_index for all the players
+
+    positions are the flat positions in the grid, globales the flat positions
+    in the state planes (with the offset of the replica)
+    """
+    agents = grille.agents
+    classe = agents.classe[ids].astype(np.intp)
+    cases = grille.nb_colonnes * grille.nb_lignes
+    distances = grille.distances.ravel()
+    H = np.take(distances, positions + (classe * cases)[:, None])
+
+    if grille.Diff != 0:
+        field = grille.Dynamic_Field.ravel()
+        H -= 0.75 * np.take(field, globales + (classe * grille.etats.size)[:, None])
+    H += np.take(grille.grad_matrix.ravel(), positions)
+    inertia = np.minimum(nu * agents.inertie[ids], 10)
+    H += penalites_historique(grille, ids) * (3 - inertia)[:, None]
+    H[:, RESTER] += inertia
+
+    # players next to a player of another class only compare the two distances
+    occupant = np.take(grille.occupant.ravel(), globales[:, :RESTER])
+    autre = (
+        dedans[:, :RESTER]
+        & (etats[:, :RESTER] == OCCUPED)
+        & (occupant >= 0)
+        & (np.take(agents.classe, np.maximum(occupant, 0)) != classe[:, None])
+    )
+    gene = np.flatnonzero(autre.any(axis=1))
+    if len(gene):
+        dernier = RESTER - 1 - np.argmax(autre[gene, ::-1], axis=1)
+        classe_autre = agents.classe[occupant[gene, dernier]].astype(np.intp)
+        H[gene] = np.take(
+            distances, positions[gene] + (classe[gene] * cases)[:, None]
+        ) - np.take(distances, positions[gene] + (classe_autre * cases)[:, None])
+    return H
+
+
+def tirer(logits, valides, u):
+    """sample one candidate per row from the softmax of the logits, with the
+    uniform draws u of the rows"""
+    logits = np.where(valides, logits, -np.inf)
+    W = np.exp(logits - logits.max(axis=1, keepdims=True))
+    cumul = np.cumsum(W, axis=1)
+    u = u[:, None] * cumul[:, -1:]
+    return np.minimum(np.count_nonzero(cumul <= u, axis=1), RESTER)
+
+
+def choisir(grille, ids, eta, nu):
+    """chosen candidate of every player, after the exchanges of places"""
+    agents = grille.agents
+    positions, dedans = candidats(grille, ids)
+    decalage = decalages(grille, ids)
+    globales = positions + decalage[:, None]
+    etats = grille.etats.ravel()[globales]
+    valides = dedans & ((etats == VIDE) | (etats == PORTE))
+    if grille.change_place != 0:
+        valides |= dedans & (etats == OCCUPED)
+    valides[:, RESTER] = True
+
+    T = (grille.nb_colonnes + grille.nb_lignes) ** 0.3
+    logits = -eta * scores(grille, ids, positions, globales, dedans, etats, nu) / T
+    choix = tirer(logits, valides, grille.tirage(ids))
+    lignes = np.arange(len(ids))
+
+    rang = np.full(agents.taille, -1)
+    rang[ids] = lignes
+    echange = np.zeros(len(ids), bool)
+    for _ in range(RESTER + 1):
+        cible = globales[lignes, choix]
+        bloque = (choix != RESTER) & (etats[lignes, choix] == OCCUPED) & ~echange
+        if not bloque.any():
+            break
+        agents.wanna_go[ids[bloque]] = cible[bloque]
+        ici = decalage + agents.x[ids] * grille.nb_lignes + agents.y[ids]
+        autre = grille.occupant.ravel()[cible]
+        mutuel = bloque & (autre >= 0)
+        mutuel[mutuel] &= agents.wanna_go[autre[mutuel]] == ici[mutuel]
+        # one draw per pair: when both players are blocked, the lower id draws
+        partenaire = np.where(mutuel, rang[np.maximum(autre, 0)], -1)
+        double = mutuel & (partenaire >= 0)
+        double[double] &= mutuel[partenaire[double]]
+        mutuel &= ~(double & (ids > autre))
+        mutuel[mutuel] &= grille.tirage(ids[mutuel]) < grille.change_place
+        if mutuel.any():
+            echanger(grille, ids[mutuel], autre[mutuel])
+            echange |= np.isin(ids, autre[mutuel]) | mutuel
+        refuse = bloque & ~echange
+        valides[lignes[refuse], choix[refuse]] = False
+        choix[refuse] = tirer(logits[refuse], valides[refuse], grille.tirage(ids[refuse]))
+    choix[echange] = RESTER
+    return globales[lignes, choix], etats[lignes, choix], choix
+
+
+def echanger(grille, a, b):
+    """exchange the places of the players a and b"""
+    agents = grille.agents
+    xa, ya = agents.x[a].copy(), agents.y[a].copy()
+    agents.x[a], agents.y[a] = agents.x[b], agents.y[b]
+    agents.x[b], agents.y[b] = xa, ya
+    occupant = grille.occupant.ravel()
+    occupant[decalages(grille, a) + agents.x[a] * grille.nb_lignes + agents.y[a]] = a
+    occupant[decalages(grille, b) + agents.x[b] * grille.nb_lignes + agents.y[b]] = b
+
+
+def resoudre_conflits(cibles, mu, aleas):
+    """indices of the players that move to their flat target cibles
+
+    A target wanted by one player is granted. A contested target is granted
+    to one random player with probability mu, otherwise nobody moves there.
+    aleas holds two uniform draws per player (n, 2): the first one orders the
+    players of a target, the second one is the draw of mu of the first player.
+    """
+    if len(cibles) == 0:
+        return np.empty(0, np.intp)
+    nombre = np.bincount(cibles)[cibles]
+    # only the contested targets are sorted, to group their players
+    disputes = np.flatnonzero(nombre > 1)
+    ordre = disputes[np.lexsort((aleas[disputes, 0], cibles[disputes]))]
+    triees = cibles[ordre]
+    premier = np.ones(len(triees), bool)
+    premier[1:] = triees[1:] != triees[:-1]
+    debut = ordre[premier]
+    return np.concatenate([np.flatnonzero(nombre == 1), debut[aleas[debut, 1] < mu]])
+
+
+def deplacer(grille, ids, cibles):
+    """move the players to the flat positions cibles of the state planes
+    (Player.move)"""
+    agents = grille.agents
+    decalage = decalages(grille, ids)
+    ici = agents.x[ids] * grille.nb_lignes + agents.y[ids]
+    agents.historique[ids, agents.tete[ids] % agents.HISTORIQUE] = ici
+    agents.tete[ids] += 1
+    etats = grille.etats.ravel()
+    occupant = grille.occupant.ravel()
+    if (etats[decalage + ici] == PRODUCTOR).any():
+        # a player that leaves a productor empties it (Player.move)
+        grille.revision_decor += 1
+    etats[decalage + ici] = VIDE
+    occupant[decalage + ici] = -1
+
+    agents.x[ids], agents.y[ids] = np.divmod(cibles - decalage, grille.nb_lignes)
+    occupant[cibles] = ids
+    etats[cibles] = np.where(etats[cibles] == PRODUCTOR, PRODUCTOR, OCCUPED)
+    grille.revision += 1
+    if grille.Diff != 0:
+        grille.deposer_champ(agents.classe[ids], cibles, grille.Diff * 10)
+    agents.inertie[ids] = 0
+
+
+def arriver(grille, ids):
+    """remove the players that reached a door (Player.arriver)"""
+    agents = grille.agents
+    ici = decalages(grille, ids) + agents.x[ids] * grille.nb_lignes + agents.y[ids]
+    if (grille.etats.ravel()[ici] == PRODUCTOR).any():
+        grille.revision_decor += 1
+    grille.etats.ravel()[ici] = VIDE
+    grille.occupant.ravel()[ici] = -1
+    grille.revision += 1
+    agents.retirer_groupe(ids)
+    agents.arrivees += len(ids)
+
+
+def etape(grille, eta, mu, nu):
+    """apply the parallel rules to every player of the grid"""
+    agents = grille.agents
+    ids = agents.vivants()
+    if len(ids) == 0:
+        return
+
+    change = grille.tirage(ids) < grille.change_class
+    nouvelle = grille.tirage(ids[change]) * len(grille.x0)
+    agents.classe[ids[change]] = nouvelle.astype(np.int8)
+
+    cibles, etats, choix = choisir(grille, ids, eta, nu)
+
+    agents.inertie[ids[choix == RESTER]] += 1
+    if grille.exit:
+        arrive = (choix != RESTER) & (etats == PORTE)
+        arriver(grille, ids[arrive])
+    bouge = (choix != RESTER) & (etats == VIDE)
+    agents.inertie[ids[bouge]] = 0
+    ids, cibles = ids[bouge], cibles[bouge]
+
+    gagnants = resoudre_conflits(cibles, mu, grille.tirage(ids, 2))
+    agents.conflits += len(cibles) - len(gagnants)
+    deplacer(grille, ids[gagnants], cibles[gagnants])
@@ -0,0 +1,79 @@
+import time
+
+
+class Ordonnanceur:
+    """
+    class that schedules the steps of the simulation and the frames of the
+    window independently
+
+    The steps follow a fixed timestep of 1 / tps seconds: several steps are
+    done between two frames when tps is above fps, and frames are skipped when
+    drawing is slower than fps. With tps = 0 the simulation steps as fast as
+    possible and only stops to draw a frame every 1 / fps seconds.
+
+    attributes:
+
+    - tps : float : target number of steps per second (0: as fast as possible)
+    - fps : float : target number of frames per second
+    - horloge : callable : clock in seconds
+    - prochain_tick : float : time of the next step
+    - prochaine_image : float : time of the next frame
+    - ticks : int : number of steps done
+    - images : int : number of frames drawn
+
+    methods:
+
+    - etapes : iterate over the steps to do before the next frame
+    - image_due : tell if a frame must be drawn now
+    - attendre : sleep until the next step or frame
+
+    """
+
+    # late steps beyond this delay (in seconds) are dropped, not caught up
+    RETARD_MAX = 0.25
+
+    def __init__(self, tps=20, fps=30, horloge=time.perf_counter):
+        self.tps = tps
+        self.fps = fps
+        self.horloge = horloge
+        maintenant = horloge()
+        self.prochain_tick = maintenant
+        self.prochaine_image = maintenant
+        self.ticks = 0
+        self.images = 0
+
+    def etapes(self):
+        """yield once for every step to do now, stop when a frame is due"""
+        premiere = True
+        while True:
+            maintenant = self.horloge()
+            if not premiere and maintenant >= self.prochaine_image:
+                return
+            if self.tps > 0:
+                if maintenant < self.prochain_tick:
+                    return
+                if maintenant - self.prochain_tick > self.RETARD_MAX:
+                    self.prochain_tick = maintenant
+                self.prochain_tick += 1 / self.tps
+            premiere = False
+            self.ticks += 1
+            yield self.ticks
+
+    def image_due(self) -> bool:
+        maintenant = self.horloge()
+        if maintenant < self.prochaine_image:
+            return False
+        # frames that could not be drawn in time are skipped
+        self.prochaine_image = max(self.prochaine_image + 1 / self.fps, maintenant)
+        self.images += 1
+        return True
+
+    def attendre(self, maximum=0.01):
+        """sleep until the next step or frame, at most maximum seconds so that
+        the events are still handled"""
+        prochain = self.prochaine_image
+        if self.tps > 0:
+            prochain = min(prochain, self.prochain_tick)
+        delai = min(prochain - self.horloge(), maximum)
+        if delai > 0:
+            time.sleep(delai)
@@ -1,24 +1,24 @@
 from simulation.cell import Cell, TYPE_CELL
+from simulation.sprites import atlas
 import pygame as pg
 import numpy as np
 import random
 
 
-image_tomate = pg.image.load("./images/auTOMATE.png")
-image_tomate2 = pg.image.load("./images/auTOMATE2.png")
-image_tomate = pg.transform.scale(image_tomate, (50, 50))
-image_tomate2 = pg.transform.scale(image_tomate2, (50, 50))
-
 class Player:
     """
     class that represents a player in the simulation
 
+    A player is a lightweight accessor over a row of the agent table of its
+    grid (Grille.agents), every attribute is read from and written to it.
+
     attributes:
 
+    - id : int : row of the player in the agent table of the grid
+    - grille : Grille : the grid the player belongs to
     - current_cell : Cell : current cell of the player
     - inertie : int : inertia of the player
     - last_encoutered : list : last encountered positions
-    - grille : Grille : the grid the player belongs to
     - image : pg.Surface : image of the player
     - classe : int : class of the player
     - is_arrived : bool : if the player has arrived
@@ -28,55 +28,97 @@ class Player:
     methods:
 
     - move : move the player to a cell
+    - arriver : remove the player from the grid
     - apply_rules : apply the rules of the simulation
     - apply_rules_parallel : apply the rules of the simulation in parallel
     - inertia_and_grad : compute the inertia and the gradient
     - choose_index : choose the index of the cell to go to
-    - change_color : change the color of the player
     - exchange : exchange the position of the player with another player
 
 
     """
 
-    def __init__(self, cell: Cell):
-        self.current_cell = cell
-        self.inertie = 0
-        self.last_encoutered = []
-        self.grille: Grille = cell.grille
-        self.image = pg.transform.scale(
-            random.choice([image_tomate, image_tomate2]),
-            (self.current_cell.taille, self.current_cell.taille),
+    __slots__ = ("grille", "id")
+
+    def __init__(self, grille, id):
+        self.grille = grille
+        self.id = int(id)
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, Player)
+            and self.id == other.id
+            and self.grille is other.grille
+        )
+
+    def __hash__(self):
+        return hash(self.id)
+
+    @property
+    def current_cell(self) -> Cell:
+        agents = self.grille.agents
+        return self.grille.cellule(agents.x[self.id], agents.y[self.id])
+
+    @current_cell.setter
+    def current_cell(self, cell: Cell):
+        self.grille.agents.x[self.id] = cell.x
+        self.grille.agents.y[self.id] = cell.y
+
+    @property
+    def classe(self):
+        return int(self.grille.agents.classe[self.id])
+
+    @classe.setter
+    def classe(self, classe):
+        self.grille.agents.classe[self.id] = classe
+
+    @property
+    def inertie(self):
+        return int(self.grille.agents.inertie[self.id])
+
+    @inertie.setter
+    def inertie(self, inertie):
+        self.grille.agents.inertie[self.id] = inertie
+
+    @property
+    def is_arrived(self):
+        return not self.grille.agents.vivant[self.id]
+
+    @property
+    def last_encoutered(self):
+        return self.grille.agents.dernieres_positions(self.id)
+
+    @property
+    def wanna_go(self):
+        position = self.grille.agents.wanna_go[self.id]
+        if position < 0:
+            return None
+        return self.grille.cellule(*divmod(int(position), self.grille.nb_lignes))
+
+    @wanna_go.setter
+    def wanna_go(self, cell: Cell):
+        self.grille.agents.wanna_go[self.id] = (
+            -1 if cell is None else cell.x * self.grille.nb_lignes + cell.y
+        )
+
+    @property
+    def image(self) -> pg.Surface:
+        return atlas.sprite(
+            self.grille.taille_cellule,
+            self.classe,
+            self.grille.agents.variante[self.id],
         )
-        self.classe = random.choice(range(len(self.grille.x0)))
-        self.is_arrived = False
-        self.wanna_go = None
-        self.current_cell.player = self
-
-        match self.classe:
-            case 1:
-                self.image.fill((0, 0, 180), special_flags=pg.BLEND_MULT)
-            case 2:
-                self.image.fill((0, 250, 0), special_flags=pg.BLEND_MULT)
-            case 3:
-                self.image.fill((0, 255, 255), special_flags=pg.BLEND_MULT)
-
-    def change_color(self):
-        match self.classe:
-            case 1:
-                self.image.fill((0, 0, 180), special_flags=pg.BLEND_MULT)
-            case 2:
-                self.image.fill((0, 250, 0), special_flags=pg.BLEND_MULT)
-            case 3:
-                self.image.fill((0, 255, 255), special_flags=pg.BLEND_MULT)
 
     def add_Field(self):
-        self.grille.Dynamic_Field[self.classe][self.current_cell.x][
-            self.current_cell.y
-        ] += self.grille.Diff * 10
+        cell = self.current_cell
+        self.grille.deposer_champ(
+            self.classe, cell.x * self.grille.nb_lignes + cell.y, self.grille.Diff * 10
+        )
 
     def move(self, cell: Cell):
-        self.last_encoutered.append((self.current_cell.x, self.current_cell.y))
-        self.current_cell.empty()
+        current_cell = self.current_cell
+        self.grille.agents.pousser_historique(self.id, current_cell.x, current_cell.y)
+        current_cell.liberer()
         self.current_cell = cell
         cell.player = self
         if not cell.current_state == TYPE_CELL.PRODUCTOR:
@@ -84,7 +126,11 @@ class Player:
         if self.grille.Diff != 0 and self.inertie == 0:
             self.add_Field()
         self.inertie = 0
-        
+
+    def arriver(self):
+        self.current_cell.liberer()
+        self.grille.agents.retirer(self.id)
+        self.grille.agents.arrivees += 1
 
     def exchange(self, cell: Cell):
         temp_player = cell.player
@@ -95,16 +141,16 @@ class Player:
     
     def random_change(self):
         self.classe = random.choice(range(len(self.grille.x0)))
-        self.change_color()
 
     def inertia_and_grad(self, H, nu, voisins_valides):
         list_i = []
+        last_encoutered = self.last_encoutered
         for j, voisin in enumerate(voisins_valides):
-            if len(self.last_encoutered) != 0:
-                for k in range(1, min(20, len(self.last_encoutered))):
+            if len(last_encoutered) != 0:
+                for k in range(1, min(20, len(last_encoutered))):
                     if (
-                        voisin.x == self.last_encoutered[-k][0]
-                        and voisin.y == self.last_encoutered[-k][1]
+                        voisin.x == last_encoutered[-k][0]
+                        and voisin.y == last_encoutered[-k][1]
                     ):
                         list_i.append(j)
 
@@ -121,7 +167,7 @@ class Player:
         H[-1] += inertia
         return H
 
-    def choose_index(self, voisins_valides, eta, nu, voisins_occuped):
+    def choose_index(self, voisins_valides, eta, nu, voisins_occuped=None):
         if voisins_occuped:
             for voisin_occ in voisins_occuped:
                 H = -np.array(
@@ -144,8 +190,10 @@ class Player:
         else:
             H = np.array([voisin.distance[self.classe] for voisin in voisins_valides])
             H = self.inertia_and_grad(H, nu, voisins_valides)
+        # shifted by the min of H, so that the best candidate has a weight of 1
+        # even when all the distances are huge (unreachable cells)
         W = np.exp(
-            (-eta * H) / (self.grille.nb_colonnes + self.grille.nb_lignes) ** 0.3
+            (-eta * (H - H.min())) / (self.grille.nb_colonnes + self.grille.nb_lignes) ** 0.3
         )
         W /= W.sum()  # Normalisation pour avoir une somme de probabilités de 1
 
@@ -186,18 +234,16 @@ class Player:
         if chosen_cell == self.current_cell:
             pass
         elif chosen_cell.current_state == TYPE_CELL.PORTE:
-            self.is_arrived = True
-            self.current_cell.empty()
-            self.current_cell = None
+            self.arriver()
         elif (
             chosen_cell.current_state == TYPE_CELL.VIDE
             or chosen_cell.current_state == TYPE_CELL.PRODUCTOR
         ):
             self.move(chosen_cell)
 
-    # Pour faire le parallèle, créer la matrice de conflit puis la gérer dans la boucle de grille/simu à voir
+    # En parallèle, les déplacements vers une case vide sont ajoutés à demandes, les conflits sont résolus par la simulation
 
-    def apply_rules_parallel(self, eta, matrice_conflit, nu):
+    def apply_rules_parallel(self, eta, demandes, nu):
         voisins = self.grille.recuperer_voisins(
             self.current_cell.x, self.current_cell.y
         )
@@ -238,13 +284,11 @@ class Player:
             self.inertie += 1
             pass
         elif chosen_cell.current_state == TYPE_CELL.PORTE and self.grille.exit:
-            self.is_arrived = True
-            self.current_cell.empty()
-            self.current_cell = None
+            self.arriver()
 
         elif (
             chosen_cell.current_state == TYPE_CELL.VIDE
             or chosen_cell.current_state == TYPE_CELL.PRODUCTOR
         ):
-            matrice_conflit[chosen_cell.x][chosen_cell.y].append(self)
+            demandes.append((self.id, chosen_cell.x * self.grille.nb_lignes + chosen_cell.y))
             self.inertie = 0
@@ -0,0 +1,157 @@
+import functools
+import time
+
+import numpy as np
+
+
+class _Chrono:
+    """context that adds its duration to a phase of a Profileur"""
+
+    __slots__ = ("profileur", "nom", "debut")
+
+    def __init__(self, profileur, nom):
+        self.profileur = profileur
+        self.nom = nom
+        self.debut = 0.0
+
+    def __enter__(self):
+        self.debut = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.profileur.ajouter(self.nom, time.perf_counter() - self.debut)
+        return False
+
+
+class _Inactif:
+    """context that does nothing, used while the profiler is disabled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+
+_INACTIF = _Inactif()
+
+
+class Profileur:
+    """
+    class that times the phases of the steps and of the drawing
+
+    A phase is timed with "with profileur.phase(nom):" (a phase can not be
+    timed inside itself), or a whole method of an object that has a profileur
+    attribute with the decorator chronometre. While the profiler is
+    disabled phase returns a shared context that does nothing, so the hooks
+    left in the code cost one method call. The last taille durations of every
+    phase are kept in a ring buffer for the rolling statistics, the number of
+    calls and the total time are kept since the last reset.
+
+    attributes:
+
+    - actif : bool : the phases are timed
+    - taille : int : number of durations kept by phase
+    - durees : dict : ring buffer of the durations (in seconds) by phase
+    - appels : dict : number of calls by phase
+    - totaux : dict : total duration (in seconds) by phase
+
+    methods:
+
+    - activer / desactiver : enable or disable the timing
+    - phase : context that times a phase
+    - ajouter : add a duration to a phase
+    - statistiques : mean, p95, max of the last durations of every phase
+    - rapport : table of the statistics
+    - reinitialiser : forget all the durations
+
+    """
+
+    def __init__(self, actif=False, taille=240):
+        self.actif = actif
+        self.taille = taille
+        self._chronos = {}
+        self.reinitialiser()
+
+    def activer(self):
+        self.actif = True
+
+    def desactiver(self):
+        self.actif = False
+
+    def reinitialiser(self):
+        self.durees = {}
+        self.appels = {}
+        self.totaux = {}
+
+    def phase(self, nom):
+        if not self.actif:
+            return _INACTIF
+        chrono = self._chronos.get(nom)
+        if chrono is None:
+            chrono = self._chronos[nom] = _Chrono(self, nom)
+        return chrono
+
+    def ajouter(self, nom, duree):
+        if nom not in self.durees:
+            self.durees[nom] = np.zeros(self.taille)
+            self.appels[nom] = 0
+            self.totaux[nom] = 0.0
+        self.durees[nom][self.appels[nom] % self.taille] = duree
+        self.appels[nom] += 1
+        self.totaux[nom] += duree
+
+    def dernieres(self, nom) -> np.array:
+        """last durations of a phase, the oldest first"""
+        appels = self.appels.get(nom, 0)
+        if appels <= self.taille:
+            return self.durees[nom][:appels] if appels else np.zeros(0)
+        debut = appels % self.taille
+        return np.roll(self.durees[nom], -debut)
+
+    def statistiques(self) -> dict:
+        """{phase: {appels, total, moyenne, p95, max}} in seconds, the rolling
+        values over the last taille calls"""
+        resultat = {}
+        for nom in self.durees:
+            dernieres = self.dernieres(nom)
+            resultat[nom] = {
+                "appels": self.appels[nom],
+                "total": self.totaux[nom],
+                "moyenne": float(dernieres.mean()),
+                "p95": float(np.percentile(dernieres, 95)),
+                "max": float(dernieres.max()),
+            }
+        return resultat
+
+    def rapport(self) -> str:
+        """table of the statistics in milliseconds, the longest phases first
+        (a phase timed inside another one is counted in both)"""
+        statistiques = self.statistiques()
+        total = sum(ligne["total"] for ligne in statistiques.values()) or 1
+        lignes = [
+            f"{'phase':<20}{'appels':>8}{'moyenne':>10}{'p95':>10}{'max':>10}{'total s':>10}{'%':>7}"
+        ]
+        for nom, ligne in sorted(statistiques.items(), key=lambda item: -item[1]["total"]):
+            lignes.append(
+                f"{nom:<20}{ligne['appels']:>8}"
+                f"{ligne['moyenne'] * 1e3:>10.3f}{ligne['p95'] * 1e3:>10.3f}{ligne['max'] * 1e3:>10.3f}"
+                f"{ligne['total']:>10.2f}{100 * ligne['total'] / total:>7.1f}"
+            )
+        return "\n".join(lignes)
+
+
+def chronometre(nom):
+    """decorator that times a method as the phase nom of self.profileur"""
+
+    def decorateur(methode):
+        @functools.wraps(methode)
+        def enveloppe(self, *args, **kwargs):
+            with self.profileur.phase(nom):
+                return methode(self, *args, **kwargs)
+
+        return enveloppe
+
+    return decorateur
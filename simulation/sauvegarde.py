@@ -0,0 +1,165 @@
+"""
+Snapshot and restore of a simulation
+
+A snapshot is one compressed NPZ file of the arrays of the simulation: the
+state planes, the players (the columns of TableAgents), the dynamic field,
+the gradient of the obstacles, the positions of the attractors, doors, walls
+and productors, the parameters of the rules and the state of the random
+generators (Grille.rng and the random and np.random modules, used by the
+setup, the productors and the sequential rules). The Cells and Players are
+views over these arrays, so nothing else is saved.
+
+A restored simulation continues exactly as the saved one would have, so a
+crowd can be stepped to a steady state once and many runs started from it:
+
+    from simulation.sauvegarde import sauvegarder, restaurer
+
+    sauvegarder(simulation, "chaud.npz")
+    for graine in range(10):
+        simulation = restaurer("chaud.npz")
+        simulation.map.rng = np.random.default_rng(graine)
+        ...
+
+The profiler, the metrics and the trajectory of the simulation are not
+saved.
+"""
+
+import json
+import random
+
+import numpy as np
+
+from simulation.agents import TableAgents
+from simulation.simulation import Simulation
+
+
+FORMAT = 1
+
+
+def _positions(positions) -> np.array:
+    return np.array(positions, np.int64).reshape(-1, 2)
+
+
+def sauvegarder(simulation: Simulation, chemin):
+    """write the state of simulation in the file chemin"""
+    grille = simulation.map
+    agents = grille.agents
+    n = agents.taille
+
+    version, etat_random, gauss = random.getstate()
+    nom, cles, position, a_gauss, gauss_np = np.random.get_state()
+    donnees = {
+        "format": FORMAT,
+        "dimensions": [grille.nb_colonnes, grille.nb_lignes],
+        "classes": len(simulation.classes),
+        "parametres": [
+            simulation.proba_wall,
+            simulation.proba_player,
+            simulation.coeff_prod,
+            grille.change_place,
+            grille.Diff,
+            grille.decay,
+            grille.change_class,
+        ],
+        "options": [
+            grille.exit,
+            grille.show_gradient,
+            grille.tomato_flag,
+            grille.champ_statique is not None,
+            grille.Dynamic_Field.dtype == np.float32,
+        ],
+        "x0": grille.x0,
+        "y0": grille.y0,
+        "porte": _positions(grille.porte),
+        "mur": _positions(grille.mur),
+        "productor": _positions(grille.productor),
+        "attractor": _positions(grille.attractor),
+        "etats": grille.etats,
+        "occupant": grille.occupant,
+        "distances": grille.distances,
+        "grad_matrix": grille.grad_matrix,
+        "Dynamic_Field": grille.Dynamic_Field,
+        "zone_champ": grille.zone_champ or [],
+        "compteurs": [n, agents.arrivees, agents.produits, agents.conflits, agents.ajoutes],
+        "libres": np.array(agents._libres, np.int64),
+        "rng": json.dumps(grille.rng.bit_generator.state),
+        "random": [version, *etat_random],
+        "random_gauss": json.dumps(gauss),
+        "np_random": cles,
+        "np_random_etat": [position, a_gauss, gauss_np],
+    }
+    if grille.noyau_obstacle is not None:
+        donnees["noyau_obstacle"] = grille.noyau_obstacle
+    for colonne in TableAgents.COLONNES:
+        donnees["agents_" + colonne] = getattr(agents, colonne)[:n]
+    np.savez_compressed(chemin, **donnees)
+
+
+def restaurer(chemin, fenetre=None) -> Simulation:
+    """a simulation in the state saved in the file chemin, ready to be
+    stepped, drawn in fenetre (headless by default)"""
+    with np.load(chemin) as fichier:
+        donnees = {nom: fichier[nom] for nom in fichier.files}
+    if int(donnees["format"]) != FORMAT:
+        raise ValueError(f"unknown snapshot format {int(donnees['format'])}")
+
+    nb_colonnes, nb_lignes = (int(n) for n in donnees["dimensions"])
+    classes = int(donnees["classes"])
+    proba_wall, proba_player, coeff_prod, change_place, Diff, decay, change_class = (
+        float(p) for p in donnees["parametres"]
+    )
+    exit, show_gradient, tomato_flag, geodesique, champ_float32 = (
+        bool(o) for o in donnees["options"]
+    )
+    simulation = Simulation(
+        fenetre,
+        nb_colonnes,
+        nb_lignes,
+        proba_wall,
+        proba_player,
+        classes,
+        classes > len(donnees["x0"]),
+        coeff_prod,
+        exit,
+        change_place,
+        Diff,
+        decay,
+        show_gradient,
+        change_class,
+        geodesique=geodesique,
+        champ_float32=champ_float32,
+    )
+
+    grille = simulation.map
+    grille.x0 = donnees["x0"].tolist()
+    grille.y0 = donnees["y0"].tolist()
+    for nom in ("porte", "mur", "productor", "attractor"):
+        setattr(grille, nom, [tuple(position) for position in donnees[nom].tolist()])
+    for nom in ("etats", "occupant", "distances", "grad_matrix", "Dynamic_Field"):
+        setattr(grille, nom, donnees[nom])
+    grille._champ_suivant = None
+    grille.zone_champ = tuple(donnees["zone_champ"].tolist()) or None
+    grille.noyau_obstacle = donnees.get("noyau_obstacle")
+    grille.tomato_flag = tomato_flag
+    grille.densite.invalider()
+
+    n, arrivees, produits, conflits, ajoutes = (int(c) for c in donnees["compteurs"])
+    agents = TableAgents(nb_lignes, max(n, 64))
+    for colonne in TableAgents.COLONNES:
+        getattr(agents, colonne)[:n] = donnees["agents_" + colonne]
+    agents.taille = n
+    agents._libres = donnees["libres"].tolist()
+    agents.arrivees = arrivees
+    agents.produits = produits
+    agents.conflits = conflits
+    agents.ajoutes = ajoutes
+    grille.agents = agents
+
+    grille.rng.bit_generator.state = json.loads(str(donnees["rng"]))
+    version, *etat_random = donnees["random"].tolist()
+    random.setstate((version, tuple(etat_random), json.loads(str(donnees["random_gauss"]))))
+    position, a_gauss, gauss_np = donnees["np_random_etat"].tolist()
+    np.random.set_state(
+        ("MT19937", donnees["np_random"], int(position), int(a_gauss), gauss_np)
+    )
+    return simulation
@@ -16,8 +16,12 @@ import random
 import sys
 import math
 from enum import Enum
-from scipy.signal import convolve2d
 from simulation.grille import Grille
+from simulation.cell import TYPE_CELL, PALETTE
+from simulation import moteur
+from simulation.profilage import Profileur, chronometre
+from simulation.metriques import Metriques
+from simulation.trajectoires import EnregistreurTrajectoire
 
 
 
@@ -38,18 +42,26 @@ class Simulation:
     """
     class that represents the simulation
 
+    Without a window (fenetre=None) the simulation is headless: it can be set
+    up with random_setup and stepped without a display, only choice_setup and
+    draw need one.
+
     attributes:
 
-    - fenetre : pg.Surface : surface of the window
+    - fenetre : pg.Surface : surface of the window (None when headless)
     - SCREEN_WIDTH : int : width of the screen
     - SCREEN_HEIGHT : int : height of the screen
     - map : Grille : the grid of the simulation
-    - cells : list : list of cells
+    - cells : generator : views over the cells of the grid
     - proba_wall : float : probability of a wall
     - proba_player : float : probability of a player
     - classes : list : list of classes
     - coeff_prod : float : coefficient of production
-
+    - profileur : Profileur : timings of the phases of the steps and drawing
+    - metriques : Metriques : values recorded after every etape (None if not
+      recorded, see enregistrer_metriques)
+    - trajectoire : EnregistreurTrajectoire : recording of the players after
+      every etape (None if not recorded, see enregistrer_trajectoire)
 
     methods:
 
@@ -57,8 +69,25 @@ class Simulation:
     - choice_setup : setup the simulation by choosing the positions
     - apply_rules : apply the rules of the simulation
     - apply_rules_parallel : apply the rules of the simulation in parallel
+    - apply_rules_vectorized : apply the parallel rules to all the players at once
     - pass_epoch : pass an epoch
     - draw : draw the simulation on the screen
+    - draw_changes : draw only the cells that changed since the last draw
+    - draw_array : draw the grid as an image of one pixel per cell
+    - rect_image : rectangle of the window where draw_array draws the grid
+    - couleurs : colours of the cells drawn by draw_array
+    - editer : apply an edit of the user (ACTIONS) at a position
+    - etape : apply the rules of a mode (sequential, parallel or vectorized)
+    - enregistrer_metriques : record the values of the grid after every etape
+    - enregistrer_trajectoire : record the players after every etape
+
+    The phases of the steps and the drawing methods are timed by profileur
+    (a Profileur, disabled by default) once it is enabled:
+    simulation.profileur.activer(), then simulation.profileur.rapport().
+
+    A simulation can be pickled (e.g. to be sent to a worker process, see
+    Travailleur): the window and the surfaces are left out, so the copy is
+    headless.
 
     """
 
@@ -77,16 +106,25 @@ class Simulation:
         Diff=0,
         Decay=0,
         show_gradient = False,
-        change_class = 0.001
+        change_class = 0.001,
+        seed=None,
+        geodesique=False,
+        champ_float32=False,
     ):
         self.fenetre = fenetre
-        screen_info = pg.display.Info()
-        self.SCREEN_WIDTH = screen_info.current_w
-        self.SCREEN_HEIGHT = screen_info.current_h
+        if fenetre is None:
+            self.SCREEN_WIDTH = self.SCREEN_HEIGHT = 0
+        else:
+            screen_info = pg.display.Info()
+            self.SCREEN_WIDTH = screen_info.current_w
+            self.SCREEN_HEIGHT = screen_info.current_h
         self.proba_wall = proba_wall
         self.proba_player = proba_player
         self.classes = range(classes)
         self.coeff_prod = coeff_prod
+        self.profileur = Profileur()
+        self.metriques = None
+        self.trajectoire = None
 
         self.map = Grille(
             nb_colonnes=nb_colonnes,
@@ -108,45 +146,48 @@ class Simulation:
             Diff=Diff,
             Decay=Decay,
             show_gradient = show_gradient,
-            change_class = change_class
+            change_class = change_class,
+            seed=seed,
+            geodesique=geodesique,
+            champ_float32=champ_float32,
         )
-        self.cells = self.map.get_cellules()
+
+    def __getstate__(self):
+        etat = self.__dict__.copy()
+        etat["fenetre"] = None
+        etat["trajectoire"] = None
+        etat.pop("_image", None)
+        etat.pop("_dessin", None)
+        return etat
+
+    @property
+    def cells(self):
+        return self.map.get_cellules()
 
     def random_setup(self):
-        for cell in self.cells:
-            if random.random() < self.proba_player:
-                self.map.add_player(cell.x, cell.y)
-            if random.random() < self.proba_wall:
-                self.map.ajouter_mur(cell.x, cell.y)
+        forme = (self.map.nb_colonnes, self.map.nb_lignes)
+        murs = np.random.random(forme) < self.proba_wall
+        joueurs = (
+            (np.random.random(forme) < self.proba_player)
+            & (self.map.etats == TYPE_CELL.VIDE.value)
+            & ~murs
+        )
+        for x, y in zip(*np.nonzero(joueurs)):
+            self.map.add_player(x, y)
+        for x, y in zip(*np.nonzero(murs)):
+            self.map.ajouter_mur(x, y)
 
     def choice_setup(self):
         running = True
 
         def add(x, y, action):
-            if x >= self.map.nb_colonnes or y >= self.map.nb_lignes:
+            self.editer(x, y, action)
+            if self.fenetre is None or x >= self.map.nb_colonnes or y >= self.map.nb_lignes:
                 return
-            cell = self.map.cellule(x, y)
-            match action:
-                case ACTIONS.ADDING_WALLS:
-                    self.map.ajouter_mur(x, y)
-                case ACTIONS.ADDING_DOORS:
-                    self.map.ajouter_porte(x, y)
-                case ACTIONS.ADDING_PLAYERS:
-                    self.map.add_player(x, y)
-                case ACTIONS.ADDING_PRODUCTORS:
-                    self.map.add_productor(x, y)
-                case ACTIONS.ADDING_EMPTY:
-                    cell.empty()
-                case ACTIONS.CHANGE_ATTRACTOR1:
-                    cell.change_attractor(0)
-                case ACTIONS.CHANGE_ATTRACTOR2:
-                    cell.change_attractor(1)
-                case ACTIONS.CHANGE_ATTRACTOR3:
-                    cell.change_attractor(2)
-                case ACTIONS.CHANGE_ATTRACTOR4:
-                    cell.change_attractor(3)
-
-            cell.draw(self.fenetre)
+            if self.map.taille_cellule == 0:
+                self.draw_array(self.fenetre)
+            else:
+                self.map.cellule(x, y).draw(self.fenetre)
 
         # initialisation de la vue
         self.draw(self.fenetre)
@@ -197,87 +238,281 @@ class Simulation:
                         action = act(action, ACTIONS.CHANGE_ATTRACTOR4)
 
                     x, y = pg.mouse.get_pos()
-                    cell_x = x // self.map.taille_cellule
-                    cell_y = y // self.map.taille_cellule
+                    cell_x = int(x / self.map.echelle)
+                    cell_y = int(y / self.map.echelle)
                     add(cell_x, cell_y, action)
 
             pg.display.update()
 
+    def editer(self, x, y, action: ACTIONS):
+        """apply an edit of the user at a position"""
+        if x >= self.map.nb_colonnes or y >= self.map.nb_lignes:
+            return
+        cell = self.map.cellule(x, y)
+        match action:
+            case ACTIONS.ADDING_WALLS:
+                self.map.ajouter_mur(x, y)
+            case ACTIONS.ADDING_DOORS:
+                self.map.ajouter_porte(x, y)
+            case ACTIONS.ADDING_PLAYERS:
+                self.map.add_player(x, y)
+            case ACTIONS.ADDING_PRODUCTORS:
+                self.map.add_productor(x, y)
+            case ACTIONS.ADDING_EMPTY:
+                cell.empty()
+            case ACTIONS.CHANGE_ATTRACTOR1:
+                cell.change_attractor(0)
+            case ACTIONS.CHANGE_ATTRACTOR2:
+                cell.change_attractor(1)
+            case ACTIONS.CHANGE_ATTRACTOR3:
+                cell.change_attractor(2)
+            case ACTIONS.CHANGE_ATTRACTOR4:
+                cell.change_attractor(3)
+
+    def etape(self, eta, mu, nu, parallel=2):
+        """apply the rules of the mode parallel (0 sequential, 1 parallel,
+        2 vectorized)"""
+        match parallel:
+            case 0:
+                self.apply_rules(eta, nu)
+            case 1:
+                self.apply_rules_parallel(eta, mu, nu)
+            case _:
+                self.apply_rules_vectorized(eta, mu, nu)
+        if self.metriques is not None:
+            with self.profileur.phase("metriques"):
+                self.metriques.enregistrer(self.map)
+        if self.trajectoire is not None:
+            with self.profileur.phase("trajectoire"):
+                self.trajectoire.enregistrer(self.map)
+
+    def enregistrer_metriques(self, capacite=1024, densite=True) -> Metriques:
+        """record the values of the grid after every etape from now on"""
+        self.metriques = Metriques(len(self.map.x0), capacite, densite)
+        self.metriques.commencer(self.map)
+        return self.metriques
+
+    def enregistrer_trajectoire(self, chemin) -> EnregistreurTrajectoire:
+        """record the players after every etape from now on in the files
+        chemin.bin and chemin.npz (see simulation.trajectoires), written when
+        the recording is closed (fermer)"""
+        self.trajectoire = EnregistreurTrajectoire(self.map, chemin)
+        return self.trajectoire
+
     def apply_rules(self, eta, nu):
-        for player in self.map.players:
-            if random.random() < self.map.change_class:
-                player.random_change()
-            if not player.is_arrived:
-                player.apply_rules(eta=eta, nu=nu)
-            else:
-                del player
-        for produc in self.map.productor:
-            if random.random() < self.coeff_prod:
-                self.map.add_player(produc[0], produc[1])
+        profileur = self.profileur
+        with profileur.phase("champ_statique"):
+            self.map.mettre_a_jour_champ()
+        with profileur.phase("decisions"):
+            for player in self.map.players:
+                if random.random() < self.map.change_class:
+                    player.random_change()
+                if not player.is_arrived:
+                    player.apply_rules(eta=eta, nu=nu)
+        with profileur.phase("producteurs"):
+            for produc in self.map.productor:
+                if random.random() < self.coeff_prod:
+                    self.map.add_player(produc[0], produc[1])
 
     def apply_rules_parallel(self, eta, mu, nu):
-        
+        profileur = self.profileur
+        with profileur.phase("champ_statique"):
+            self.map.mettre_a_jour_champ()
         if self.map.Diff != 0:
-            self.map.decay_Field()
-            self.map.diffusion_Field()
-
-        matrice_conflit = [
-            [[] for _ in range(self.map.nb_lignes)] for _ in range(self.map.nb_colonnes)
-        ]
-        for player in self.map.players:
-            if random.random() < self.map.change_class:
-                player.random_change()
-            if not player.is_arrived:
-                player.apply_rules_parallel(
-                    eta=eta, matrice_conflit=matrice_conflit, nu=nu
+            with profileur.phase("diffusion"):
+                self.map.decay_Field()
+                self.map.diffusion_Field()
+
+        # (id, flat target) of the players that want to move to an empty cell
+        demandes = []
+        with profileur.phase("decisions"):
+            for player in self.map.players:
+                if random.random() < self.map.change_class:
+                    player.random_change()
+                if not player.is_arrived:
+                    player.apply_rules_parallel(eta=eta, demandes=demandes, nu=nu)
+        if demandes:
+            with profileur.phase("conflits"):
+                ids, cibles = np.array(demandes).T
+                gagnants = moteur.resoudre_conflits(
+                    cibles, mu, self.map.rng.random((len(cibles), 2))
                 )
-            else:
-                self.map.players.remove(player)
-                del player
-        for x in range(self.map.nb_colonnes):
-            for y in range(self.map.nb_lignes):
-                if len(matrice_conflit[x][y]) > 1 and random.random() < mu:
-                    random.shuffle(matrice_conflit[x][y])
-                    matrice_conflit[x][y][0].move(self.map.cellule(x, y))
-                elif len(matrice_conflit[x][y]) == 1:
-                    matrice_conflit[x][y][0].move(self.map.cellule(x, y))
-        for produc in self.map.productor:
-            if random.random() < self.coeff_prod:
-                self.map.add_player(produc[0], produc[1])
+                self.map.agents.conflits += len(cibles) - len(gagnants)
+            with profileur.phase("deplacements"):
+                moteur.deplacer(self.map, ids[gagnants], cibles[gagnants])
+        with profileur.phase("producteurs"):
+            for produc in self.map.productor:
+                if random.random() < self.coeff_prod:
+                    self.map.add_player(produc[0], produc[1])
+
+    def apply_rules_vectorized(self, eta, mu, nu):
+        profileur = self.profileur
+        with profileur.phase("champ_statique"):
+            self.map.mettre_a_jour_champ()
+        if self.map.Diff != 0:
+            with profileur.phase("diffusion"):
+                self.map.decay_Field()
+                self.map.diffusion_Field()
+
+        with profileur.phase("moteur"):
+            moteur.etape(self.map, eta, mu, nu)
+        with profileur.phase("producteurs"):
+            for produc in self.map.productor:
+                if self.map.rng.random() < self.coeff_prod:
+                    self.map.add_player(produc[0], produc[1])
 
     def pass_epoch(self):
         for cell in self.cells:
             cell.pass_epoch()
     
+    def _fenetre_densite(self, x_densite, y_densite, rect_size=7):
+        """cells (x_start, x_end, y_start, y_end) of the window of a density"""
+        half_rect = rect_size // 2
+        return (
+            max(0, x_densite - half_rect),
+            min(self.map.nb_colonnes, x_densite + half_rect + 1),
+            max(0, y_densite - half_rect),
+            min(self.map.nb_lignes, y_densite + half_rect + 1),
+        )
+
+    @chronometre("densite")
     def draw_max_densite(self, fenetre):
+        """draw the window of max density, return its cells (None if not drawn)"""
         if not hasattr(self, 'max_density'):
             self.max_density = 0
-            return
+            return None
         self.max_density, (x_densite, y_densite) = self.map.recuperer_max_densite_grille()
-        
+        return self.dessiner_densite(fenetre, x_densite, y_densite)
+
+    def dessiner_densite(self, fenetre, x_densite, y_densite):
+        """draw the window of a density centred on a cell, return its cells"""
+        echelle = self.map.echelle
         # draw max density
-        overlay = pg.Surface((self.map.taille_cellule, self.map.taille_cellule), pg.SRCALPHA)
+        overlay = pg.Surface((max(echelle, 1), max(echelle, 1)), pg.SRCALPHA)
         overlay.fill((255, 255, 0, 100))  # RGBA color with 100 alpha for 40% opacity
-        fenetre.blit(overlay, (x_densite * self.map.taille_cellule, y_densite * self.map.taille_cellule))
+        fenetre.blit(overlay, (int(x_densite * echelle), int(y_densite * echelle)))
 
         # draw surrounding rectangle
-        rect_size = 7
-        half_rect = rect_size // 2
-        x_start = max(0, x_densite - half_rect)
-        y_start = max(0, y_densite - half_rect)
-        x_end = min(self.map.nb_colonnes, x_densite + half_rect + 1)
-        y_end = min(self.map.nb_lignes, y_densite + half_rect + 1)
+        x_start, x_end, y_start, y_end = self._fenetre_densite(x_densite, y_densite)
 
-        overlay = pg.Surface((self.map.taille_cellule * (x_end - x_start), self.map.taille_cellule * (y_end - y_start)), pg.SRCALPHA)
+        overlay = pg.Surface((echelle * (x_end - x_start), echelle * (y_end - y_start)), pg.SRCALPHA)
         overlay.fill((255, 255, 0, 50))  # RGBA color with 50 alpha for 20% opacity
-        fenetre.blit(overlay, (x_start * self.map.taille_cellule, y_start * self.map.taille_cellule))
-
+        fenetre.blit(overlay, (int(x_start * echelle), int(y_start * echelle)))
+        return x_start, x_end, y_start, y_end
+
+    def _apparences(self):
+        """plane of what is drawn on every cell: two cells with the same value
+        are drawn the same way by Cell.draw"""
+        grille = self.map
+        apparence = grille.etats.astype(np.int32)
+        occupees = (grille.etats == TYPE_CELL.OCCUPED.value) & (grille.occupant >= 0)
+        ids = grille.occupant[occupees]
+        motif = grille.agents.classe[ids].astype(np.int32)
+        if grille.tomato_flag:
+            motif += 4 * (1 + grille.agents.variante[ids])
+        apparence[occupees] += 16 * (1 + motif)
+        if grille.show_gradient:
+            vides = grille.etats == TYPE_CELL.VIDE.value
+            teinte = np.clip(255 - grille.Dynamic_Field[0][vides] * 25, 0, 255)
+            apparence[vides] += 16 * (1 + teinte.astype(np.int32))
+        return apparence
+
+    @chronometre("dessin")
     def draw(self, fenetre):
         # clear the screen
         fenetre.fill((255, 255, 255))
 
+        if self.map.taille_cellule == 0:
+            # the cells are smaller than a pixel, only the image can show them
+            self.draw_array(fenetre)
+            return
+
         # draw players
         for cell in self.cells:
             cell.draw(fenetre)
 
+        self._dessin = self._apparences()
+        self._zone_densite = self.draw_max_densite(fenetre)
+
+    @chronometre("dessin_changements")
+    def draw_changes(self, fenetre, zones=()):
+        """draw only the cells that changed since the last draw, and the cells
+        under the pixel rectangles zones, return the rectangles to update"""
+        if self.map.taille_cellule == 0:
+            # the cells are smaller than a pixel, only the image can show them
+            return self.draw_array(fenetre)
+        if getattr(self, "_dessin", None) is None:
+            self.draw(fenetre)
+            return [fenetre.get_rect()]
+        grille = self.map
+        taille = grille.taille_cellule
+        apparence = self._apparences()
+        modifiees = apparence != self._dessin
+
+        # the translucent window of max density is drawn again on fresh cells
+        fenetres = [self._zone_densite]
+        if hasattr(self, "max_density"):
+            fenetres.append(self._fenetre_densite(*grille.recuperer_max_densite_grille()[1]))
+        for x_start, x_end, y_start, y_end in filter(None, fenetres):
+            modifiees[x_start:x_end, y_start:y_end] = True
+        for zone in zones:
+            modifiees[
+                max(0, zone.left // taille) : max(0, -(-zone.right // taille)),
+                max(0, zone.top // taille) : max(0, -(-zone.bottom // taille)),
+            ] = True
+
+        # the labels of the attractors may overflow on the cells around them
+        attracteurs = grille.etats >= TYPE_CELL.ATTRACTOR1.value
+        modifiees &= ~attracteurs
+        rects = []
+        for x, y in zip(*np.nonzero(modifiees)):
+            rect = pg.Rect(x * taille, y * taille, taille, taille)
+            fenetre.fill((255, 255, 255), rect)
+            grille.cellule(x, y).draw(fenetre)
+            rects.append(rect)
+        if rects:
+            for x, y in zip(*np.nonzero(attracteurs)):
+                grille.cellule(x, y).draw(fenetre)
+                rects.append(pg.Rect(x * taille, y * taille, taille, taille))
+
+        self._dessin = apparence
+        self._zone_densite = self.draw_max_densite(fenetre)
+        if len(rects) > modifiees.size // 4:
+            return [pg.Rect(0, 0, grille.nb_colonnes * taille, grille.nb_lignes * taille)]
+        return rects
+
+    def couleurs(self) -> np.array:
+        """uint8 colours of the cells from PALETTE, indexed [x, y, rgb]"""
+        grille = self.map
+        code = grille.etats.astype(np.intp)
+        occupees = (code == TYPE_CELL.OCCUPED.value) & (grille.occupant >= 0)
+        code[occupees] = len(TYPE_CELL) + grille.agents.classe[grille.occupant[occupees]]
+        couleurs = PALETTE[code]
+        if grille.show_gradient:
+            vides = code == TYPE_CELL.VIDE.value
+            couleurs[vides, 1] = np.clip(255 - grille.Dynamic_Field[0][vides] * 25, 0, 255)
+        return couleurs
+
+    def rect_image(self) -> pg.Rect:
+        """rectangle of the window where draw_array draws the grid"""
+        grille = self.map
+        return pg.Rect(
+            0, 0, int(grille.nb_colonnes * grille.echelle), int(grille.nb_lignes * grille.echelle)
+        )
+
+    @chronometre("dessin_image")
+    def draw_array(self, fenetre):
+        """draw the grid from the colours of PALETTE, one pixel per cell scaled
+        by grille.echelle (shrunk when the grid is larger than the window),
+        return the rectangle to update"""
+        couleurs = self.couleurs()
+        if getattr(self, "_image", None) is None or self._image.get_size() != couleurs.shape[:2]:
+            self._image = pg.Surface(couleurs.shape[:2])
+        pg.surfarray.blit_array(self._image, couleurs)
+        rect = self.rect_image()
+        pg.transform.scale(self._image, rect.size, fenetre.subsurface(rect))
+
+        # the cells drawn by draw_changes are no longer on the screen
+        self._dessin = None
         self.draw_max_densite(fenetre)
+        return [rect]
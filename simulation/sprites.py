@@ -0,0 +1,52 @@
+import pygame as pg
+
+
+class AtlasSprites:
+    """
+    class that keeps the images of the players in tomato mode
+
+    An image is scaled and tinted once for every (size, class, variant) and
+    shared by all the players, which only store their class and variant
+    (TableAgents.classe and TableAgents.variante).
+
+    attributes:
+
+    - chemins : tuple : files of the images of the variants
+    - images : tuple : images of the variants, loaded at the first use
+    - sprites : dict : images by (size, class, variant)
+
+    methods:
+
+    - sprite : get the image of a player
+
+    """
+
+    # colour multiplied with the image of every class (None: not tinted)
+    TEINTES = (None, (0, 0, 180), (0, 250, 0), (0, 255, 255))
+
+    def __init__(self, chemins=("./images/auTOMATE.png", "./images/auTOMATE2.png")):
+        self.chemins = chemins
+        self.images = None
+        self.sprites = {}
+
+    def _charger(self):
+        self.images = tuple(
+            pg.transform.scale(pg.image.load(chemin), (50, 50)) for chemin in self.chemins
+        )
+
+    def sprite(self, taille, classe, variante) -> pg.Surface:
+        cle = (int(taille), int(classe), int(variante))
+        if cle not in self.sprites:
+            if self.images is None:
+                self._charger()
+            image = pg.transform.scale(self.images[cle[2]], (cle[0], cle[0]))
+            if cle[1] < len(self.TEINTES) and self.TEINTES[cle[1]] is not None:
+                image.fill(self.TEINTES[cle[1]], special_flags=pg.BLEND_MULT)
+            if pg.display.get_surface() is not None:
+                image = image.convert_alpha()
+            self.sprites[cle] = image
+        return self.sprites[cle]
+
+
+# atlas shared by the players of all the grids
+atlas = AtlasSprites()
@@ -0,0 +1,204 @@
+"""
+Recording and replay of the trajectories of the players
+
+A recording is made of two files:
+
+- chemin.bin : the records of the players on the grid after every step, one
+  fixed-width record (ENREGISTREMENT) per player and per step, the steps one
+  after the other. It is written by appending and read as a np.memmap, so a
+  replay only reads the steps it shows.
+- chemin.npz : the index of the records (offset of the first record of every
+  step), the births and deaths of the players (identifiant of TableAgents,
+  never reused) and the static cells (walls, doors, productors, attractors)
+  at the start and after every edit.
+
+    enregistreur = simulation.enregistrer_trajectoire("course")
+    for _ in range(1000):
+        simulation.etape(eta, mu, nu)
+    enregistreur.fermer()
+
+    trajectoire = Trajectoire("course")
+    trajectoire.joueurs(500)  # records of the step 500
+"""
+
+import numpy as np
+
+from simulation.cell import TYPE_CELL, PALETTE
+
+
+ENREGISTREMENT = np.dtype(
+    [
+        ("identifiant", "<i4"),
+        ("x", "<i2"),
+        ("y", "<i2"),
+        ("classe", "i1"),
+        ("variante", "i1"),
+    ]
+)
+
+# kinds of the events
+NAISSANCE = 1
+MORT = 0
+
+EVENEMENT = np.dtype([("etape", "<i4"), ("identifiant", "<i4"), ("type", "i1")])
+
+
+def _decor(grille):
+    """state plane of the grid without the players"""
+    decor = grille.etats.copy()
+    decor[decor == TYPE_CELL.OCCUPED.value] = TYPE_CELL.VIDE.value
+    return decor
+
+
+class EnregistreurTrajectoire:
+    """
+    class that appends the positions of the players of a grid after every
+    step to a recording (see the module)
+
+    attributes:
+
+    - chemin : str : path of the recording, without extension
+    - fichier : file : chemin.bin, open while recording
+    - etapes : int : number of recorded steps (the start is the step 0)
+    - decalages : list : offset of the first record of every step
+    - evenements : list : arrays of the births and deaths of every step
+    - decors : list : (step, state plane) of the static cells when they change
+      (grille.revision_decor, so the plane is only copied after an edit)
+
+    methods:
+
+    - enregistrer : append the players of the grid after a step
+    - fermer : write the index and close the recording
+
+    """
+
+    def __init__(self, grille, chemin):
+        self.chemin = chemin
+        self.nb_colonnes = grille.nb_colonnes
+        self.nb_lignes = grille.nb_lignes
+        self.classes = len(grille.x0)
+        self.fichier = open(chemin + ".bin", "wb")
+        self.etapes = 0
+        self.decalages = [0]
+        self.evenements = []
+        self.decors = []
+        self._revision = None
+        self._presents = np.empty(0, np.int64)
+        self.enregistrer(grille)
+
+    def enregistrer(self, grille):
+        agents = grille.agents
+        ids = agents.vivants()
+        enregistrements = np.empty(len(ids), ENREGISTREMENT)
+        enregistrements["identifiant"] = agents.identifiant[ids]
+        enregistrements["x"] = agents.x[ids]
+        enregistrements["y"] = agents.y[ids]
+        enregistrements["classe"] = agents.classe[ids]
+        enregistrements["variante"] = agents.variante[ids]
+        self.fichier.write(enregistrements.tobytes())
+        self.decalages.append(self.decalages[-1] + len(ids))
+
+        presents = np.sort(agents.identifiant[ids])
+        for identifiants, type in (
+            (np.setdiff1d(presents, self._presents, assume_unique=True), NAISSANCE),
+            (np.setdiff1d(self._presents, presents, assume_unique=True), MORT),
+        ):
+            if len(identifiants):
+                evenements = np.empty(len(identifiants), EVENEMENT)
+                evenements["etape"] = self.etapes
+                evenements["identifiant"] = identifiants
+                evenements["type"] = type
+                self.evenements.append(evenements)
+        self._presents = presents
+
+        if grille.revision_decor != self._revision:
+            self.decors.append((self.etapes, _decor(grille)))
+            self._revision = grille.revision_decor
+        self.etapes += 1
+
+    def fermer(self):
+        if self.fichier.closed:
+            return
+        self.fichier.close()
+        np.savez_compressed(
+            self.chemin + ".npz",
+            decalages=np.array(self.decalages, np.int64),
+            evenements=np.concatenate(self.evenements or [np.empty(0, EVENEMENT)]),
+            decor_etapes=np.array([etape for etape, _ in self.decors], np.int32),
+            decors=np.stack([decor for _, decor in self.decors]),
+            forme=np.array([self.nb_colonnes, self.nb_lignes, self.classes]),
+        )
+
+
+class Trajectoire:
+    """
+    class that reads a recording (see the module) without loading it
+
+    attributes:
+
+    - nb_colonnes : int : number of columns of the grid
+    - nb_lignes : int : number of rows of the grid
+    - classes : int : number of classes
+    - enregistrements : np.memmap : records of all the steps
+    - decalages : np.array : offset of the first record of every step
+    - evenements : np.array : births and deaths (EVENEMENT)
+
+    methods:
+
+    - joueurs : records of the players of a step
+    - decor : static cells at a step
+    - couleurs : colours of the cells at a step, as Simulation.couleurs
+    - parcours : positions of a player over the steps
+
+    """
+
+    def __init__(self, chemin):
+        with np.load(chemin + ".npz") as index:
+            self.decalages = index["decalages"]
+            self.evenements = index["evenements"]
+            self._decor_etapes = index["decor_etapes"]
+            self._decors = index["decors"]
+            self.nb_colonnes, self.nb_lignes, self.classes = (int(n) for n in index["forme"])
+        if self.decalages[-1]:
+            self.enregistrements = np.memmap(chemin + ".bin", ENREGISTREMENT, mode="r")
+        else:
+            self.enregistrements = np.empty(0, ENREGISTREMENT)
+
+    def __len__(self):
+        return len(self.decalages) - 1
+
+    def joueurs(self, etape) -> np.array:
+        return self.enregistrements[self.decalages[etape] : self.decalages[etape + 1]]
+
+    def decor(self, etape) -> np.array:
+        return self._decors[np.searchsorted(self._decor_etapes, etape, side="right") - 1]
+
+    def couleurs(self, etape) -> np.array:
+        """uint8 colours of the cells at a step, indexed [x, y, rgb]"""
+        code = self.decor(etape).astype(np.intp)
+        joueurs = self.joueurs(etape)
+        # a player on a productor keeps the colour of the productor
+        joueurs = joueurs[code[joueurs["x"], joueurs["y"]] == TYPE_CELL.VIDE.value]
+        code[joueurs["x"], joueurs["y"]] = len(TYPE_CELL) + joueurs["classe"]
+        return PALETTE[code]
+
+    def parcours(self, identifiant) -> np.array:
+        """(step, x, y) of a player at every step it was on the grid"""
+        naissances = self.evenements[
+            (self.evenements["identifiant"] == identifiant)
+            & (self.evenements["type"] == NAISSANCE)
+        ]
+        if len(naissances) == 0:
+            return np.empty((0, 3), np.int64)
+        morts = self.evenements[
+            (self.evenements["identifiant"] == identifiant)
+            & (self.evenements["type"] == MORT)
+        ]
+        debut = int(naissances["etape"][0])
+        fin = int(morts["etape"][0]) if len(morts) else len(self)
+        positions = []
+        for etape in range(debut, fin):
+            joueurs = self.joueurs(etape)
+            ligne = joueurs[joueurs["identifiant"] == identifiant]
+            positions.append((etape, int(ligne["x"][0]), int(ligne["y"][0])))
+        return np.array(positions, np.int64).reshape(-1, 3)
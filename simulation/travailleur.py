@@ -0,0 +1,209 @@
+import queue
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+import pygame as pg
+
+from simulation.simulation import Simulation, ACTIONS
+
+
+# values published with every frame, in this order
+STATS = ("etape", "joueurs", "max_density", "x_densite", "y_densite", "arrivees")
+
+
+def _vues(memoire, nb_colonnes, nb_lignes):
+    """arrays (stats, couleurs) over the shared memory of a worker"""
+    stats = np.ndarray((len(STATS),), np.float64, buffer=memoire.buf)
+    couleurs = np.ndarray(
+        (nb_colonnes, nb_lignes, 3), np.uint8, buffer=memoire.buf, offset=stats.nbytes
+    )
+    return stats, couleurs
+
+
+def _publier(simulation, etape, stats, couleurs, verrou):
+    grille = simulation.map
+    image = simulation.couleurs()
+    max_density, (x_densite, y_densite) = grille.recuperer_max_densite_grille()
+    with verrou:
+        couleurs[...] = image
+        stats[:] = (
+            etape,
+            len(grille.agents),
+            max_density,
+            x_densite,
+            y_densite,
+            grille.agents.arrivees,
+        )
+
+
+def _boucle(simulation, nom, verrou, commandes, eta, mu, nu, parallel, tps, fps):
+    """loop of the worker process: apply the commands, step, publish at
+    most fps frames per second"""
+    memoire = shared_memory.SharedMemory(name=nom)
+    stats, couleurs = _vues(memoire, simulation.map.nb_colonnes, simulation.map.nb_lignes)
+    etape = 0
+    pause = False
+    prochain = time.perf_counter()
+    periode = 1 / fps if fps > 0 else 0
+    _publier(simulation, etape, stats, couleurs, verrou)
+    publie = time.perf_counter()
+    # the grid changed since the last published frame
+    change = False
+    try:
+        while True:
+            # a paused worker waits for the commands instead of spinning
+            try:
+                commande = commandes.get(timeout=0.05) if pause else commandes.get_nowait()
+            except queue.Empty:
+                commande = None
+            while commande is not None:
+                match commande:
+                    case ("editer", x, y, action):
+                        simulation.editer(x, y, ACTIONS(action))
+                        change = True
+                    case ("delete_class", classe):
+                        simulation.map.delete_class(classe)
+                        change = True
+                    case ("open_class", classe):
+                        simulation.map.open_class(classe)
+                        change = True
+                    case ("pause",):
+                        pause = not pause
+                    case ("arreter",):
+                        return
+                try:
+                    commande = commandes.get_nowait()
+                except queue.Empty:
+                    commande = None
+
+            if not pause:
+                simulation.etape(eta, mu, nu, parallel)
+                etape += 1
+                change = True
+            # the window reads one frame per display frame, the steps in
+            # between are not published
+            if change and time.perf_counter() - publie >= periode:
+                _publier(simulation, etape, stats, couleurs, verrou)
+                publie = time.perf_counter()
+                change = False
+
+            if tps > 0 and not pause:
+                prochain = max(prochain + 1 / tps, time.perf_counter() - 0.25)
+                delai = prochain - time.perf_counter()
+                if delai > 0:
+                    time.sleep(delai)
+    finally:
+        del stats, couleurs
+        memoire.close()
+
+
+class Travailleur:
+    """
+    class that runs a simulation in a worker process
+
+    The worker steps its copy of the simulation (see Simulation.__getstate__)
+    as fast as possible, or tps steps per second, and at most fps times per
+    second publishes the colours of the cells (Simulation.couleurs) and the
+    values of STATS in a shared memory. The window only reads the last published
+    frame, so drawing never waits for a step and a slow step never freezes
+    the events. The edits of the user are sent to the worker through a queue
+    and applied between two steps.
+
+    attributes:
+
+    - simulation : Simulation : simulation of the window, used for the sizes
+      and the drawing of the density (its grid is not updated)
+    - memoire : SharedMemory : stats then colours of the last frame
+    - stats : np.array : values of STATS of the last frame
+    - couleurs : np.array : uint8 colours of the last frame, indexed [x, y, rgb]
+    - verrou : Lock : lock held while a frame is written or read
+    - commandes : Queue : commands sent to the worker
+    - processus : Process : worker process
+
+    methods:
+
+    - envoyer : send a command to the worker
+    - editer : send an edit of the user (Simulation.editer)
+    - lire : values of STATS of the last frame
+    - dessiner : draw the last frame
+    - arreter : stop the worker and free the shared memory
+
+    """
+
+    def __init__(self, simulation: Simulation, eta, mu, nu, parallel=2, tps=0, fps=30):
+        self.simulation = simulation
+        nb_colonnes = simulation.map.nb_colonnes
+        nb_lignes = simulation.map.nb_lignes
+        self.memoire = shared_memory.SharedMemory(
+            create=True, size=8 * len(STATS) + nb_colonnes * nb_lignes * 3
+        )
+        self.stats, self.couleurs = _vues(self.memoire, nb_colonnes, nb_lignes)
+        self.stats[:] = 0
+        self.couleurs[...] = simulation.couleurs()
+        self._image = None
+
+        # spawn: the worker must not inherit the display of the window
+        contexte = mp.get_context("spawn")
+        self.verrou = contexte.Lock()
+        self.commandes = contexte.Queue()
+        self.processus = contexte.Process(
+            target=_boucle,
+            args=(
+                simulation,
+                self.memoire.name,
+                self.verrou,
+                self.commandes,
+                eta,
+                mu,
+                nu,
+                parallel,
+                tps,
+                fps,
+            ),
+            daemon=True,
+        )
+        self.processus.start()
+
+    def envoyer(self, *commande):
+        """send a command: ("editer", x, y, action), ("delete_class", k),
+        ("open_class", k), ("pause",) or ("arreter",)"""
+        self.commandes.put(commande)
+
+    def editer(self, x, y, action: ACTIONS):
+        if action != ACTIONS.DO_NOTHING:
+            self.envoyer("editer", x, y, action.value)
+
+    def lire(self) -> dict:
+        with self.verrou:
+            return dict(zip(STATS, self.stats.tolist()))
+
+    def dessiner(self, fenetre):
+        """draw the last frame as Simulation.draw_array, return the rectangle
+        to update"""
+        with self.verrou:
+            couleurs = self.couleurs.copy()
+            stats = dict(zip(STATS, self.stats.tolist()))
+        if self._image is None:
+            self._image = pg.Surface(couleurs.shape[:2])
+        pg.surfarray.blit_array(self._image, couleurs)
+        rect = self.simulation.rect_image()
+        pg.transform.scale(self._image, rect.size, fenetre.subsurface(rect))
+        self.simulation.max_density = stats["max_density"]
+        self.simulation.dessiner_densite(
+            fenetre, int(stats["x_densite"]), int(stats["y_densite"])
+        )
+        return [rect]
+
+    def arreter(self, delai=1):
+        if self.processus.is_alive():
+            self.envoyer("arreter")
+            self.processus.join(delai)
+            if self.processus.is_alive():
+                self.processus.terminate()
+                self.processus.join()
+        self.commandes.close()
+        del self.stats, self.couleurs
+        self.memoire.close()
+        self.memoire.unlink()
@@ -1,4 +1,5 @@
 import pygame as pg
+from style.text_cache import cache_texte
 
 class Button:
     """
@@ -38,8 +39,7 @@ class Button:
         pg.draw.rect(fenetre, (0, 0, 0), self.rect, 3, border_radius=15)
 
         # Center the text on the button
-        button_font = pg.font.Font(None, 50)
-        button_text = button_font.render(self.text, True, (255, 255, 255))
+        button_text = cache_texte.render(self.text, 50, (255, 255, 255))
         fenetre.blit(
             button_text,
             (
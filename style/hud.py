@@ -0,0 +1,154 @@
+import time
+
+import pygame as pg
+from style.text_cache import cache_texte
+
+
+class Hud:
+    """
+    Class that draws an overlay of the performances of the simulation: steps
+    per second, frames per second, number of players and a rolling chart of
+    the time spent in every phase of the Profileur of the simulation.
+
+    The rates and the texts are updated every PERIODE seconds only, so that
+    the texts come from cache_texte most of the time. The chart is a cached
+    surface that is scrolled by one pixel every frame, only its new column is
+    drawn: one column is the time of the phases during one frame, stacked,
+    the full height being budget seconds.
+
+    attributes:
+
+    - x : int : x position of the overlay
+    - y : int : y position of the overlay
+    - largeur : int : width of the overlay (and number of frames in the chart)
+    - budget : float : time of the full height of the chart, in seconds
+    - imbriquees : tuple : phases timed inside another one, not stacked in
+      the chart
+    - visible : bool : the overlay is drawn
+    - tps : float : steps per second over the last period
+    - fps : float : frames per second over the last period
+    - phases : dict : time of every phase by frame over the last period (s)
+    - couleurs : dict : colour of every phase
+    - rect : pg.Rect : rectangle of the overlay
+
+    methods:
+
+    - basculer : show or hide the overlay
+    - mesurer : count a frame, with the steps done and the profiler totals
+    - draw : draw the overlay, return its rectangle
+
+    """
+
+    PERIODE = 0.5
+    HAUTEUR_GRAPHE = 60
+    HAUTEUR_LIGNE = 22
+    FOND = (30, 30, 30)
+    TEXTE = (255, 255, 255)
+    PALETTE = (
+        (230, 80, 80),
+        (80, 170, 230),
+        (240, 200, 60),
+        (120, 210, 120),
+        (200, 120, 220),
+        (250, 150, 60),
+        (160, 160, 160),
+        (80, 220, 200),
+    )
+
+    def __init__(
+        self,
+        x=10,
+        y=10,
+        largeur=240,
+        budget=1 / 30,
+        imbriquees=("densite",),
+        horloge=time.perf_counter,
+    ):
+        self.x = x
+        self.y = y
+        self.largeur = largeur
+        self.budget = budget
+        self.imbriquees = imbriquees
+        self.horloge = horloge
+        self.visible = False
+        self.tps = 0.0
+        self.fps = 0.0
+        self.phases = {}
+        self.couleurs = {}
+        self.rect = pg.Rect(x, y, 0, 0)
+        self._graphe = pg.Surface((largeur, self.HAUTEUR_GRAPHE))
+        self._graphe.fill(self.FOND)
+        self._debut = horloge()
+        self._ticks = None
+        self._images = 0
+        self._totaux = {}
+        self._periode = {}
+
+    def basculer(self):
+        self.visible = not self.visible
+
+    def mesurer(self, ticks, totaux=None):
+        """count a frame: ticks is the number of steps done since the start,
+        totaux the total time of every phase since the start (Profileur.totaux)"""
+        if self._ticks is None:
+            self._ticks = ticks
+        self._images += 1
+        totaux = totaux or {}
+        frame = {nom: total - self._totaux.get(nom, 0.0) for nom, total in totaux.items()}
+        self._totaux = dict(totaux)
+        for nom, duree in frame.items():
+            self._periode[nom] = self._periode.get(nom, 0.0) + duree
+            if nom not in self.couleurs:
+                self.couleurs[nom] = self.PALETTE[len(self.couleurs) % len(self.PALETTE)]
+        if self.visible:
+            self._colonne(frame)
+
+        maintenant = self.horloge()
+        duree = maintenant - self._debut
+        if duree >= self.PERIODE:
+            self.tps = (ticks - self._ticks) / duree
+            self.fps = self._images / duree
+            self.phases = {nom: total / self._images for nom, total in self._periode.items()}
+            self._debut = maintenant
+            self._ticks = ticks
+            self._images = 0
+            self._periode = {}
+
+    def _colonne(self, frame):
+        """scroll the chart and draw the phases of the last frame"""
+        self._graphe.scroll(-1, 0)
+        x = self.largeur - 1
+        self._graphe.fill(self.FOND, (x, 0, 1, self.HAUTEUR_GRAPHE))
+        bas = self.HAUTEUR_GRAPHE
+        for nom, duree in frame.items():
+            if nom in self.imbriquees:
+                continue
+            hauteur = round(duree / self.budget * self.HAUTEUR_GRAPHE)
+            if hauteur <= 0:
+                continue
+            hauteur = min(hauteur, bas)
+            bas -= hauteur
+            self._graphe.fill(self.couleurs[nom], (x, bas, 1, hauteur))
+            if bas == 0:
+                break
+
+    def draw(self, fenetre: pg.Surface, joueurs) -> pg.Rect:
+        if not self.visible:
+            self.rect = pg.Rect(self.x, self.y, 0, 0)
+            return self.rect
+        lignes = [
+            (f"TPS {self.tps:.0f}   FPS {self.fps:.0f}", self.TEXTE),
+            (f"joueurs {joueurs}", self.TEXTE),
+        ] + [
+            (f"{nom} {duree * 1e3:.2f} ms", self.couleurs[nom])
+            for nom, duree in self.phases.items()
+        ]
+        hauteur = 5 + len(lignes) * self.HAUTEUR_LIGNE + self.HAUTEUR_GRAPHE + 5
+        self.rect = pg.Rect(self.x, self.y, self.largeur + 10, hauteur)
+        fenetre.fill(self.FOND, self.rect)
+        y = self.y + 5
+        for texte, couleur in lignes:
+            fenetre.blit(cache_texte.render(texte, 24, couleur), (self.x + 5, y))
+            y += self.HAUTEUR_LIGNE
+        fenetre.blit(self._graphe, (self.x + 5, y))
+        return self.rect
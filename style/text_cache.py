@@ -0,0 +1,46 @@
+import pygame as pg
+from collections import OrderedDict
+
+
+class TextCache:
+    """
+    Class that keeps the fonts and the rendered texts of the game, so that a
+    font is loaded once and a text is rendered once while it is displayed.
+
+    attributes:
+
+    - capacite : int : max number of rendered texts kept
+    - polices : dict : fonts by (name, size)
+    - rendus : OrderedDict : rendered texts, the least recently used first
+
+    methods:
+
+    - police : get a font, loaded at the first use
+    - render : get a rendered text, the least recently used one is forgotten
+      when there are more than capacite texts
+
+    """
+
+    def __init__(self, capacite=256):
+        self.capacite = capacite
+        self.polices = {}
+        self.rendus = OrderedDict()
+
+    def police(self, taille, nom=None) -> pg.font.Font:
+        if (nom, taille) not in self.polices:
+            self.polices[nom, taille] = pg.font.Font(nom, taille)
+        return self.polices[nom, taille]
+
+    def render(self, texte, taille, couleur, nom=None) -> pg.Surface:
+        cle = (texte, taille, tuple(couleur), nom)
+        if cle in self.rendus:
+            self.rendus.move_to_end(cle)
+        else:
+            self.rendus[cle] = self.police(taille, nom).render(texte, True, couleur)
+            if len(self.rendus) > self.capacite:
+                self.rendus.popitem(last=False)
+        return self.rendus[cle]
+
+
+# cache shared by the cells, the buttons and the game
+cache_texte = TextCache()